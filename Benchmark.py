@@ -0,0 +1,188 @@
+import sys
+import json
+import queue
+import random
+import argparse
+import resource
+import statistics
+import multiprocessing
+from time import time
+
+import CSP
+import Local
+import Generator
+
+BASELINE_PATH = "benchmark_baseline.json"
+TIMEOUT = 60  # seconds per instance
+TOLERANCE = 0.25  # a metric regresses when it grows by more than this fraction of the baseline
+MIN_SECONDS_CHANGE = 0.05  # wall time changes smaller than this are noise
+
+# size sweeps of square boards: each case is generated with a number of seeds and summarised over them.
+# CSP instances plant piecesPerRow pieces per row, Local instances put a third of the free squares
+# on the board and plant K of them.
+SWEEPS = {"CSP-mixed": {"solver": "CSP", "sizes": [8, 12, 16, 20, 25], "obstacles": 0.1, "mix": None, "piecesPerRow": 1},
+          "CSP-queens": {"solver": "CSP", "sizes": [8, 12, 16, 20, 25], "obstacles": 0.0, "mix": {"Queen": 1}, "piecesPerRow": 1},
+          "CSP-dense": {"solver": "CSP", "sizes": [8, 12, 16, 20, 25], "obstacles": 0.1,
+                        "mix": {"King": 1, "Bishop": 1, "Knight": 1}, "piecesPerRow": 2},
+          "Local-mixed": {"solver": "Local", "sizes": [5, 6, 8, 10], "obstacles": 0.1, "mix": None, "kRatio": 0.5},
+          }
+QUICK_SIZES = {"CSP": [8, 12], "Local": [5, 6]}
+
+def getCases(quick: bool = False, localMode: str = None) -> list:
+    '''(case name, solver, size, sweep) of every case of the sweeps. Local cases searched with a
+    local mode are named after it, so that they have baselines of their own.'''
+    cases = []
+    for sweepName, sweep in SWEEPS.items():
+        sizes = QUICK_SIZES[sweep["solver"]] if quick else sweep["sizes"]
+        if sweep["solver"] == "Local" and localMode != None:
+            sweepName += "-" + localMode
+        for size in sizes:
+            cases.append((sweepName + "-" + str(size), sweep["solver"], size, sweep))
+    return cases
+
+def generateInstance(solver: str, size: int, sweep: dict, seed: int) -> str:
+    if solver == "CSP":
+        return Generator.generateCSP(size, size, sweep["obstacles"], int(sweep["piecesPerRow"] * size), sweep["mix"], seed)
+    return Generator.generateLocal(size, size, sweep["obstacles"], None, sweep["kRatio"], sweep["mix"], seed)
+
+def getPeakMemoryMB() -> float:
+    '''Peak resident memory of the process. Linux's /proc gives the process's own, while ru_maxrss
+    (kilobytes on Linux) carries over the peak of the process it was started from.'''
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(solver: str, text: str, seed: int, results, localMode: str = None) -> None:
+    '''Solve an instance in a fresh process, so that its peak memory is the instance's own, and
+    report the wall time, the peak resident memory and the work done: nodes expanded for CSP,
+    neighbours evaluated (and steps) for Local, whose random restarts are seeded and which searches
+    with the local mode, Local.SEARCH_MODE by default'''
+    random.seed(seed)
+    startTime = time()
+    if solver == "CSP":
+        csp = CSP.parseText(text)
+        solution = CSP.runSearch(csp)
+        measurement = {"work": csp.nodesExpanded, "status": "solved" if solution else "unsolved"}
+    else:
+        Local.INSTRUMENT = True
+        solution, record = Local.searchWithStats(Local.parseText(text), mode=localMode)
+        # Local always returns its best configuration, which has threats unless it is a goal state
+        measurement = {"work": record["neighboursEvaluated"], "steps": record["steps"], "restarts": record["restarts"],
+                       "stepsToGoal": record["stepsToGoal"], "status": "solved" if record["isGoal"] else "unsolved"}
+    measurement["seconds"] = time() - startTime
+    measurement["peakMemoryMB"] = getPeakMemoryMB()
+    results.put(measurement)
+
+def runInstance(solver: str, text: str, seed: int, timeout: float, localMode: str = None) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=measure, args=(solver, text, seed, results, localMode))
+    process.start()
+    try:
+        measurement = results.get(timeout=timeout)
+    except queue.Empty:
+        process.terminate()
+        measurement = {"status": "timeout", "seconds": timeout, "work": None, "peakMemoryMB": None}
+    process.join()
+    return measurement
+
+def summarize(measurements: list) -> dict:
+    '''Median wall time and work and highest peak memory of the measurements of a case'''
+    finished = [measurement for measurement in measurements if measurement["status"] != "timeout"]
+    summary = {"instances": len(measurements),
+               "solved": len([measurement for measurement in measurements if measurement["status"] == "solved"]),
+               "seconds": statistics.median([measurement["seconds"] for measurement in measurements])}
+    summary["work"] = statistics.median([measurement["work"] for measurement in finished]) if len(finished) != 0 else None
+    summary["peakMemoryMB"] = max([measurement["peakMemoryMB"] for measurement in finished]) if len(finished) != 0 else None
+    return summary
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list:
+    '''Metrics of the summary that grew by more than the tolerance over the baseline'''
+    regressions = []
+    if summary["solved"] / summary["instances"] < baseline["solved"] / baseline["instances"]:
+        regressions.append("solved")
+    for metric in ["seconds", "work", "peakMemoryMB"]:
+        if baseline.get(metric) == None:
+            continue
+        if summary[metric] == None:
+            regressions.append(metric)
+        elif summary[metric] > baseline[metric] * (1 + tolerance):
+            if metric != "seconds" or summary[metric] - baseline[metric] > MIN_SECONDS_CHANGE:
+                regressions.append(metric)
+    return regressions
+
+def formatChange(value, baseValue) -> str:
+    if value == None:
+        return "-"
+    text = str(round(value, 3))
+    if baseValue != None and baseValue != 0:
+        text += " (" + format(value / baseValue - 1, "+.0%") + ")"
+    return text
+
+def runBenchmark(quick: bool = False, numOfInstances: int = 3, timeout: float = TIMEOUT, baselinePath: str = BASELINE_PATH,
+                 saveBaseline: bool = False, tolerance: float = TOLERANCE, outputPath: str = None, localMode: str = None) -> bool:
+    '''Run every case and print its summary next to the baseline's. Returns whether nothing regressed.'''
+    baseline = {}
+    if not saveBaseline:
+        try:
+            with open(baselinePath) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print("no baseline at " + baselinePath + ", only reporting")
+
+    output = open(outputPath, "a") if outputPath != None else None
+    summaries = {}
+    regressed = False
+    print("%-28s %8s %18s %18s %18s  %s" % ("case", "solved", "seconds", "work", "peak MB", "regressions"))
+    for name, solver, size, sweep in getCases(quick, localMode):
+        measurements = []
+        for seed in range(numOfInstances):
+            measurement = runInstance(solver, generateInstance(solver, size, sweep, seed), seed, timeout, localMode)
+            measurements.append(measurement)
+            if output != None:
+                record = {"case": name, "solver": solver, "size": size, "seed": seed}
+                record.update(measurement)
+                output.write(json.dumps(record) + "\n")
+        summary = summaries[name] = summarize(measurements)
+
+        base = baseline.get(name, {})
+        regressions = compare(summary, base, tolerance) if len(base) != 0 else []
+        regressed = regressed or len(regressions) != 0
+        print("%-28s %8s %18s %18s %18s  %s" % (name, str(summary["solved"]) + "/" + str(summary["instances"]),
+                                                formatChange(summary["seconds"], base.get("seconds")),
+                                                formatChange(summary["work"], base.get("work")),
+                                                formatChange(summary["peakMemoryMB"], base.get("peakMemoryMB")),
+                                                " ".join(regressions)))
+        sys.stdout.flush()
+
+    if output != None:
+        output.close()
+    if saveBaseline:
+        with open(baselinePath, "w") as f:
+            json.dump(summaries, f, indent=2)
+        print("saved baseline to " + baselinePath)
+    return not regressed
+
+def main() -> None:
+    argumentParser = argparse.ArgumentParser(description="Run both solvers over size sweeps of generated instances and "
+                                             "compare wall time, work and peak memory against a stored baseline.")
+    argumentParser.add_argument("--quick", action="store_true", help="only the smallest sizes")
+    argumentParser.add_argument("--instances", type=int, default=3, help="instances per case")
+    argumentParser.add_argument("--timeout", type=float, default=TIMEOUT, help="seconds per instance")
+    argumentParser.add_argument("--baseline", default=BASELINE_PATH, help="path of the baseline")
+    argumentParser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    argumentParser.add_argument("--tolerance", type=float, default=TOLERANCE, help="growth over the baseline that counts as a regression")
+    argumentParser.add_argument("--output", help="path to append every measurement to as JSON lines")
+    argumentParser.add_argument("--local-mode", choices=Local.SEARCH_MODES, help="search mode of the Local cases")
+    arguments = argumentParser.parse_args()
+    passed = runBenchmark(arguments.quick, arguments.instances, arguments.timeout, arguments.baseline,
+                          arguments.save_baseline, arguments.tolerance, arguments.output, arguments.local_mode)
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
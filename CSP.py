@@ -1,6 +1,54 @@
 import sys
 import itertools
-# import numpy as np
+import heapq
+import random
+import multiprocessing
+import queue
+import json
+from fractions import Fraction
+from time import time, perf_counter
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# board engine used by State: "dict" keeps a dict of candidate types per square,
+# "bitboard" keeps one bitmask of candidate squares per piece type,
+# "numpy" keeps one boolean array of candidate squares per piece type (needs NumPy)
+BOARD_ENGINE = "dict"
+
+# boards with at least this many squares use the "numpy" engine when NumPy is installed, since
+# scoring every value of a node with whole-board array operations beats a loop over the squares
+# from about 10x10 up. None keeps BOARD_ENGINE on every board.
+NUMPY_MIN_SQUARES = 100
+
+# "backtrack" runs one search, "portfolio" races differently configured searches in worker processes,
+# "min-conflicts" tries local search first and falls back to backtracking if it runs out of steps
+SEARCH_MODE = "backtrack"
+NUM_OF_WORKERS = multiprocessing.cpu_count()
+PORTFOLIO_POLL_SECONDS = 0.1  # how often the portfolio checks for workers that died without reporting
+
+# solve the regions that obstacles wall off from each other separately, see searchRegions. On boards
+# walled into rooms of 3x3 or 4x4 squares holding as many pieces as the rooms can take, or one more,
+# backTrack on the whole board runs out of 20 seconds where splitting takes milliseconds. On boards
+# walled into two halves it is as fast as backTrack, and proves some mixes of kings and queens that do
+# not fit in seconds instead of minutes. Boards that are one region go to backTrack either way.
+SPLIT_REGIONS = True
+# regions of at most MAX_LISTED_SQUARES squares with at most MAX_LISTED_PLACEMENTS placements of any
+# numbers of pieces have them all listed in one search. Larger regions have more placements than that.
+MAX_LISTED_SQUARES = 16
+MAX_LISTED_PLACEMENTS = 1000
+
+MIN_CONFLICTS_MAX_STEPS = 5000
+MIN_CONFLICTS_PLATEAU_STEPS = 100  # restart after this many steps without a new lowest number of conflicts
+
+# boards whose attack tables and region results are kept between searches, the oldest are dropped first
+MAX_CACHED_BOARDS = 256
+
+# count and time what the backtracking search does, see SearchStats. Each search appends its
+# statistics as a JSON line to TRACE_PATH, if set.
+INSTRUMENT = False
+TRACE_PATH = None
 
 class Piece:
 
@@ -15,6 +63,12 @@ class Piece:
                 "Empty": [],
                 }
 
+    # one direction of every line that a sliding piece threatens along
+    lines = {"Rook": [(-1, 0, 0), (0, -1, 0)],
+             "Bishop": [(-1, -1, 0), (-1, 1, 0)],
+             "Queen": [(-1, 0, 0), (0, -1, 0), (-1, -1, 0), (-1, 1, 0)],
+             }
+
     def __init__(self, pieceType: str) -> None:
         self.type = pieceType
 
@@ -22,10 +76,71 @@ class Piece:
         return Piece.movement[enemyType]
 
 
+def buildAttackTable(cols: int, rows: int, listOfObstacles) -> dict:
+    '''For every movement and square, the squares along the movement up to the edge of the board
+    or the first obstacle (inclusive). table[movement][x][y] is a tuple of (x, y) positions.'''
+    obstacles = set(listOfObstacles)
+    table = {}
+    for movements in Piece.movement.values():
+        for movement in movements:
+            if movement in table:
+                continue
+            xChange, yChange, maxSteps = movement
+            if maxSteps == 0:
+                maxSteps = max(cols, rows)
+            squares = []
+            for x in range(cols):
+                squares.append([])
+                for y in range(rows):
+                    ray = []
+                    for i in range(1, maxSteps + 1):
+                        newX, newY = x + i * xChange, y + i * yChange
+                        if (0 > newX or newX >= cols) or (0 > newY or newY >= rows):
+                            break
+                        ray.append((newX, newY))
+                        if (newX, newY) in obstacles:
+                            break
+                    squares[x].append(tuple(ray))
+            table[movement] = squares
+    return table
+
+attackTables = {}  # (cols, rows, obstacles) -> attack table
+
+def getAttackTable(cols: int, rows: int, listOfObstacles) -> dict:
+    '''Attack table for the board, shared by every board with the same size and obstacles'''
+    key = (cols, rows, frozenset(listOfObstacles))
+    if key not in attackTables:
+        if len(attackTables) >= MAX_CACHED_BOARDS:
+            del attackTables[next(iter(attackTables))]
+        attackTables[key] = buildAttackTable(cols, rows, listOfObstacles)
+    return attackTables[key]
+
+
+def findSymmetries(cols: int, rows: int, listOfObstacles) -> list:
+    '''Symmetries of the board other than the identity that map the obstacles onto themselves.
+    Each symmetry is a 2D array holding the image (x, y) of every position.'''
+    transforms = [lambda x, y: (cols - 1 - x, y),
+                  lambda x, y: (x, rows - 1 - y),
+                  lambda x, y: (cols - 1 - x, rows - 1 - y)]
+    if cols == rows:
+        transforms += [lambda x, y: (y, x),
+                       lambda x, y: (rows - 1 - y, cols - 1 - x),
+                       lambda x, y: (rows - 1 - y, x),
+                       lambda x, y: (y, cols - 1 - x)]
+
+    obstacles = set(listOfObstacles)
+    symmetries = []
+    for transform in transforms:
+        if any(transform(x, y) not in obstacles for x, y in obstacles):
+            continue
+        symmetries.append([[transform(x, y) for y in range(rows)] for x in range(cols)])
+    return symmetries
+
+
 class Board:
 
 
-    def __init__(self, cols: int, rows: int, listOfObstacles, maxNumOfEachEnemy) -> None:
+    def __init__(self, cols: int, rows: int, listOfObstacles, maxNumOfEachEnemy, attackTable = None) -> None:
         self.enemyPos = {}  # (x, y) -> Enemy type
         self.numberOfEachEnemy = {
             "King": 0, 
@@ -39,6 +154,13 @@ class Board:
         self.board_size_x = cols
         self.board_size_y = rows
         self.maxNumOfEachEnemy = maxNumOfEachEnemy
+
+        # every change made by addEnemyPiece is recorded here so that it can be undone
+        self.trail = []
+
+        if attackTable == None:
+            attackTable = getAttackTable(cols, rows, listOfObstacles)
+        self.attackTable = attackTable
         
         # 2D array to store possible enemy types at the particular position
         self.possibleEnemyTypes = []
@@ -53,6 +175,25 @@ class Board:
             self.possibleEnemyTypes.append([])
             for j in range(rows):
                 self.possibleEnemyTypes[i].append(sample.copy())
+
+        # live counts over the unoccupied squares, kept up to date by every change to possibleEnemyTypes
+        self.domainSize = {}  # piece type -> number of squares that can still take it
+        for enemy in sample:
+            self.domainSize[enemy] = cols * rows
+        self.numOfOpenPositions = cols * rows if len(sample) != 0 else 0
+
+        # pieceType -> (x, y) -> positions threatened by the piece at (x, y). These only depend on the
+        # pieces along the rays from (x, y), so placing or removing a piece only invalidates the entries
+        # on the rays through it. Invalidation is deferred to the next lookup so that a piece placed
+        # and removed again in between costs nothing.
+        self.threatenedCache = {}
+        self.changedPositions = {}
+        self.slidingMovements = {}  # sliding movement -> piece types using it
+        for enemy in sample:
+            self.threatenedCache[enemy] = {}
+            for movement in Piece.movement[enemy]:
+                if movement[2] == 0:
+                    self.slidingMovements.setdefault(movement, []).append(enemy)
         
         # add the obstacles
         for x, y in listOfObstacles:
@@ -66,40 +207,636 @@ class Board:
         return (x, y) in self.enemyPos
 
     def addEnemyPiece(self, pieceType: str, x: int, y: int) -> None:
+        self.trail.append(("Enemy", x, y, (pieceType, self.possibleEnemyTypes[x][y])))
+        self.clearSquare(x, y)
         self.enemyPos[(x, y)] = pieceType
-        self.possibleEnemyTypes[x][y] = {pieceType: True}
         self.numberOfEachEnemy[pieceType] += 1
+        self.possibleEnemyTypes[x][y] = {pieceType: True}
+        # before the lookups below, which flush the invalidations that stop at this piece
+        self.toggleChangedPosition(x, y)
         
         # mark all threatened position's available pieces as []
-        transitionModel = pieceMovementModel(self, x, y, pieceType)
-        # for threatenedX, threatenedY in transitionModel.getAllPossibleNewPos():
-        #     self.possibleEnemyTypes[threatenedX][threatenedY] = set()
-        def f(i, j):
+        for i, j in self.getThreatenedPositions(pieceType, x, y):
+            if len(self.possibleEnemyTypes[i][j]) == 0 or (i, j) in self.enemyPos:
+                continue
+            self.trail.append(("Square", i, j, self.possibleEnemyTypes[i][j]))
+            self.clearSquare(i, j)
             self.possibleEnemyTypes[i][j] = {}
-        transitionModel.getAllPossibleNewPos(f)
-
 
         # for all other pieces type, T, at the position, mark the threatened available pieces -T
-        for otherType in Piece.enemyTypes:
+        for otherType in self.threatenedCache:
             if otherType == pieceType:
                 continue
-            transitionModel = pieceMovementModel(self, x, y, otherType)
-            # for threatenedX, threatenedY in transitionModel.getAllPossibleNewPos():
-            #     self.possibleEnemyTypes[threatenedX][threatenedY].discard(otherType)
-            def f(i, j):
-                if otherType in self.possibleEnemyTypes[i][j]:
+            for i, j in self.getThreatenedPositions(otherType, x, y):
+                if otherType in self.possibleEnemyTypes[i][j] and (i, j) not in self.enemyPos:
                     del self.possibleEnemyTypes[i][j][otherType]
-            transitionModel.getAllPossibleNewPos(f)
+                    self.domainSize[otherType] -= 1
+                    if len(self.possibleEnemyTypes[i][j]) == 0:
+                        self.numOfOpenPositions -= 1
+                    self.trail.append(("Type", i, j, otherType))
+
+    def removeCandidate(self, pieceType: str, x: int, y: int) -> None:
+        '''Rule out the piece type at an unoccupied position until the trail is undone past this point'''
+        if not self.isPossible(pieceType, x, y):
+            return
+        del self.possibleEnemyTypes[x][y][pieceType]
+        self.domainSize[pieceType] -= 1
+        if len(self.possibleEnemyTypes[x][y]) == 0:
+            self.numOfOpenPositions -= 1
+        self.trail.append(("Type", x, y, pieceType))
+
+    def getThreatenedPositions(self, pieceType: str, x: int, y: int) -> list:
+        '''Positions threatened by the piece, including the first obstacle or enemy piece on each ray'''
+        if len(self.changedPositions) != 0:
+            for changedX, changedY in self.changedPositions:
+                self.invalidateThreatenedPositions(changedX, changedY)
+            self.changedPositions = {}
+        cache = self.threatenedCache.get(pieceType)
+        if cache == None:
+            return pieceMovementModel(self, x, y, pieceType).getAllPossibleNewPos()
+        if (x, y) not in cache:
+            cache[(x, y)] = pieceMovementModel(self, x, y, pieceType).getAllPossibleNewPos()
+        return cache[(x, y)]
+
+    def toggleChangedPosition(self, x: int, y: int) -> None:
+        if (x, y) in self.changedPositions:
+            del self.changedPositions[(x, y)]
+        else:
+            self.changedPositions[(x, y)] = True
+
+    def invalidateThreatenedPositions(self, x: int, y: int) -> None:
+        '''Drop the cached entries of every position whose rays reach (x, y)'''
+        # movements are symmetric, so those are the positions on the rays from (x, y)
+        for movement in self.slidingMovements:
+            caches = [self.threatenedCache[pieceType] for pieceType in self.slidingMovements[movement]]
+            for position in self.attackTable[movement][x][y]:
+                for cache in caches:
+                    cache.pop(position, None)
+                if position in self.enemyPos:
+                    break
+
+    def clearSquare(self, x: int, y: int) -> None:
+        '''Take the candidates of an unoccupied square out of the live counts'''
+        if len(self.possibleEnemyTypes[x][y]) == 0:
+            return
+        for pieceType in self.possibleEnemyTypes[x][y]:
+            self.domainSize[pieceType] -= 1
+        self.numOfOpenPositions -= 1
+
+    def restoreSquare(self, x: int, y: int, candidates: dict) -> None:
+        '''Put back the candidates of a square that was cleared'''
+        self.possibleEnemyTypes[x][y] = candidates
+        if len(candidates) == 0:
+            return
+        for pieceType in candidates:
+            self.domainSize[pieceType] += 1
+        self.numOfOpenPositions += 1
+
+    def getTrailMark(self) -> int:
+        return len(self.trail)
+
+    def undoToMark(self, mark: int) -> list:
+        '''Revert every change recorded on the trail after the mark, most recent first.
+        Returns the positions of the enemy pieces that were removed.'''
+        removed = []
+        while len(self.trail) > mark:
+            change, x, y, value = self.trail.pop()
+            if change == "Type":
+                if len(self.possibleEnemyTypes[x][y]) == 0:
+                    self.numOfOpenPositions += 1
+                self.possibleEnemyTypes[x][y][value] = True
+                self.domainSize[value] += 1
+            elif change == "Square":
+                self.restoreSquare(x, y, value)
+            else:
+                pieceType, candidates = value
+                del self.enemyPos[(x, y)]
+                self.numberOfEachEnemy[pieceType] -= 1
+                self.restoreSquare(x, y, candidates)
+                self.toggleChangedPosition(x, y)
+                removed.append((x, y))
+        return removed
         
     def addObstaclePiece(self, x: int, y: int) -> None:
+        if (x, y) not in self.enemyPos:
+            self.clearSquare(x, y)
         self.obstaclePos[(x, y)] = True
         self.possibleEnemyTypes[x][y] = {}
 
+    def isPossible(self, pieceType: str, x: int, y: int) -> bool:
+        return (x, y) not in self.enemyPos and pieceType in self.possibleEnemyTypes[x][y]
+
+    def getPossiblePositions(self, pieceType: str) -> list:
+        '''All unoccupied positions where the piece type can still be placed'''
+        positions = []
+        for x, y in itertools.product(range(self.board_size_x), range(self.board_size_y)):
+            if self.isPossible(pieceType, x, y):
+                positions.append((x, y))
+        return positions
+
+    def countPossiblePositions(self, pieceType: str) -> int:
+        return self.domainSize.get(pieceType, 0)
+
+    def countOpenPositions(self) -> int:
+        '''Number of unoccupied positions that can still take at least one piece type'''
+        return self.numOfOpenPositions
+
+    def countThreatenedPositions(self, pieceType: str, x: int, y: int) -> int:
+        return len(self.getThreatenedPositions(pieceType, x, y))
+
+    def countRemovedCandidates(self, pieceType: str, x: int, y: int) -> int:
+        '''Number of (position, piece type) candidates that placing the piece would remove'''
+        threatened = self.getThreatenedPositions(pieceType, x, y)
+        count = len(self.possibleEnemyTypes[x][y])
+        for i, j in threatened:
+            if (i, j) not in self.enemyPos:
+                count += len(self.possibleEnemyTypes[i][j])
+
+        threatened = set(threatened)
+        for otherType in self.threatenedCache:
+            if otherType == pieceType:
+                continue
+            for i, j in self.getThreatenedPositions(otherType, x, y):
+                if (i, j) not in threatened and self.isPossible(otherType, i, j):
+                    count += 1
+        return count
+
+    def isWithinBoard(self, x, y) -> bool:
+        if (0 > x or x >= self.board_size_x) or (0 > y or y >= self.board_size_y):
+            return False
+        return True
+
+
+class BitBoard:
+    '''Board engine that keeps the domain of each piece type as one integer bitmask over the board.
+
+    Square (x, y) is bit x * rows + y, so iterating over the set bits visits squares in
+    the same order as itertools.product(range(cols), range(rows)).
+    '''
+
+    def __init__(self, cols: int, rows: int, listOfObstacles, maxNumOfEachEnemy, attackTable = None) -> None:
+        self.enemyPos = {}  # (x, y) -> Enemy type
+        self.numberOfEachEnemy = {
+            "King": 0, 
+            "Queen": 0, 
+            "Bishop": 0, 
+            "Rook": 0, 
+            "Knight": 0
+        } 
+        self.obstaclePos = {}
+
+        self.board_size_x = cols
+        self.board_size_y = rows
+        self.maxNumOfEachEnemy = maxNumOfEachEnemy
+        self.trail = []
+        if attackTable == None:
+            attackTable = getAttackTable(cols, rows, listOfObstacles)
+        self.attackTable = attackTable
+
+        self.obstacleMask = 0
+        for x, y in listOfObstacles:
+            self.obstaclePos[(x, y)] = True
+            self.obstacleMask |= 1 << self.toIndex(x, y)
+        self.occupiedMask = 0
+
+        # remaining candidate squares of each piece type that we are interested in
+        self.domain = {}
+        freeMask = ((1 << (cols * rows)) - 1) & ~self.obstacleMask
+        for enemy in Piece.enemyTypes:
+            if maxNumOfEachEnemy[enemy] != 0:
+                self.domain[enemy] = freeMask
+
+        # rays[direction][square]: squares along the direction up to the edge or the first obstacle
+        self.rays = {}
+        for enemy in Piece.enemyTypes:
+            for movement in Piece.movement[enemy]:
+                if movement not in self.rays:
+                    self.rays[movement] = self.buildRays(movement)
+
+    def toIndex(self, x: int, y: int) -> int:
+        return x * self.board_size_y + y
+
+    def toXY(self, index: int) -> tuple:
+        return (index // self.board_size_y, index % self.board_size_y)
+
+    def buildRays(self, movement) -> list:
+        rays = []
+        for x, y in itertools.product(range(self.board_size_x), range(self.board_size_y)):
+            mask = 0
+            for newX, newY in self.attackTable[movement][x][y]:
+                mask |= 1 << self.toIndex(newX, newY)
+            rays.append(mask)
+        return rays
+
+    def getAttackMask(self, pieceType: str, x: int, y: int) -> int:
+        '''Squares threatened by the piece, including the first obstacle or enemy piece on each ray'''
+        index = self.toIndex(x, y)
+        attack = 0
+        for movement in Piece.movement[pieceType]:
+            rays = self.rays[movement]
+            ray = rays[index]
+            blockers = ray & self.occupiedMask
+            if blockers and movement[2] == 0:
+                # cut the ray after the nearest enemy piece
+                if movement[0] * self.board_size_y + movement[1] > 0:
+                    nearest = (blockers & -blockers).bit_length() - 1
+                else:
+                    nearest = blockers.bit_length() - 1
+                ray &= ~rays[nearest]
+            attack |= ray
+        return attack
+
+    def isBlocked(self, x: int, y:int) -> bool:
+        '''Occupied by enemy piece or by obstacle piece'''
+        return ((x, y) in self.obstaclePos) or ((x, y) in self.enemyPos)
+
+    def isOccupiedByEnemyPiece(self, x: int, y: int) -> bool:
+        return (x, y) in self.enemyPos
+
+    def isWithinBoard(self, x, y) -> bool:
+        if (0 > x or x >= self.board_size_x) or (0 > y or y >= self.board_size_y):
+            return False
+        return True
+
+    def addEnemyPiece(self, pieceType: str, x: int, y: int) -> None:
+        self.trail.append(("Enemy", x, y, (pieceType, self.occupiedMask, tuple(self.domain.items()))))
+        self.enemyPos[(x, y)] = pieceType
+        self.numberOfEachEnemy[pieceType] += 1
+
+        # squares threatened by the piece can no longer take any piece
+        # and no other type may be placed where it would threaten the piece
+        square = 1 << self.toIndex(x, y)
+        threatened = self.getAttackMask(pieceType, x, y) | square
+        for otherType in self.domain:
+            if otherType == pieceType:
+                self.domain[otherType] &= ~threatened
+            else:
+                self.domain[otherType] &= ~(threatened | self.getAttackMask(otherType, x, y))
+        self.occupiedMask |= square
+
+    def getTrailMark(self) -> int:
+        return len(self.trail)
+
+    def undoToMark(self, mark: int) -> list:
+        '''Revert every change made after the mark, most recent first.
+        Returns the positions of the enemy pieces that were removed.'''
+        removed = []
+        while len(self.trail) > mark:
+            change, x, y, value = self.trail.pop()
+            if change == "Type":
+                self.domain[value] |= 1 << self.toIndex(x, y)
+            else:
+                pieceType, self.occupiedMask, domain = value
+                self.domain = dict(domain)
+                del self.enemyPos[(x, y)]
+                self.numberOfEachEnemy[pieceType] -= 1
+                removed.append((x, y))
+        return removed
+
+    def removeCandidate(self, pieceType: str, x: int, y: int) -> None:
+        '''Rule out the piece type at an unoccupied position until the trail is undone past this point'''
+        if not self.isPossible(pieceType, x, y):
+            return
+        self.domain[pieceType] &= ~(1 << self.toIndex(x, y))
+        self.trail.append(("Type", x, y, pieceType))
+
+    def isPossible(self, pieceType: str, x: int, y: int) -> bool:
+        return (self.domain.get(pieceType, 0) >> self.toIndex(x, y)) & 1 == 1
+
+    def getPossiblePositions(self, pieceType: str) -> list:
+        '''All unoccupied positions where the piece type can still be placed'''
+        positions = []
+        mask = self.domain.get(pieceType, 0)
+        while mask:
+            lowest = mask & -mask
+            positions.append(self.toXY(lowest.bit_length() - 1))
+            mask ^= lowest
+        return positions
+
+    def countPossiblePositions(self, pieceType: str) -> int:
+        return self.domain.get(pieceType, 0).bit_count()
+
+    def countOpenPositions(self) -> int:
+        '''Number of unoccupied positions that can still take at least one piece type'''
+        mask = 0
+        for pieceType in self.domain:
+            mask |= self.domain[pieceType]
+        return mask.bit_count()
+
+    def countThreatenedPositions(self, pieceType: str, x: int, y: int) -> int:
+        return self.getAttackMask(pieceType, x, y).bit_count()
+
+    def countRemovedCandidates(self, pieceType: str, x: int, y: int) -> int:
+        '''Number of (position, piece type) candidates that placing the piece would remove'''
+        square = 1 << self.toIndex(x, y)
+        threatened = self.getAttackMask(pieceType, x, y) | square
+        count = 0
+        for otherType in self.domain:
+            if otherType == pieceType:
+                count += (self.domain[otherType] & threatened).bit_count()
+            else:
+                count += (self.domain[otherType] & (threatened | self.getAttackMask(otherType, x, y))).bit_count()
+        return count
+
+
+# one direction of each line of the board, as used by the "numpy" engine
+LINE_STEPS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+
+boardIndexes = {}  # (cols, rows) -> (lines, steps), see getBoardIndex
+
+def getBoardIndex(cols: int, rows: int) -> tuple:
+    '''Index arrays of the "numpy" engine, which keeps the squares of the board in flat arrays with the
+    square (x, y) at x * rows + y and an extra square at cols * rows that stands for "off the board".
+
+    lines[(xChange, yChange)] is a 2D array holding the squares of every line of the board in order
+    along the direction, padded with the extra square. steps[(xChange, yChange)] holds for every square
+    (and the extra one) the square one step away, or the extra square if the step leaves the board.'''
+    key = (cols, rows)
+    if key in boardIndexes:
+        return boardIndexes[key]
+    if len(boardIndexes) >= MAX_CACHED_BOARDS:
+        del boardIndexes[next(iter(boardIndexes))]
+    offBoard = cols * rows
+
+    lines = {}
+    for xChange, yChange in LINE_STEPS:
+        squares = []
+        for x, y in itertools.product(range(cols), range(rows)):
+            if 0 <= x - xChange < cols and 0 <= y - yChange < rows:
+                continue
+            line = []
+            while 0 <= x < cols and 0 <= y < rows:
+                line.append(x * rows + y)
+                x, y = x + xChange, y + yChange
+            squares.append(line)
+        length = max([len(line) for line in squares])
+        lines[(xChange, yChange)] = np.array([line + [offBoard] * (length - len(line)) for line in squares])
+
+    steps = {}
+    for movements in Piece.movement.values():
+        for xChange, yChange, maxSteps in movements:
+            if maxSteps != 1 or (xChange, yChange) in steps:
+                continue
+            squares = []
+            for x, y in itertools.product(range(cols), range(rows)):
+                newX, newY = x + xChange, y + yChange
+                squares.append(newX * rows + newY if 0 <= newX < cols and 0 <= newY < rows else offBoard)
+            steps[(xChange, yChange)] = np.array(squares + [offBoard])
+
+    boardIndexes[key] = (lines, steps)
+    return boardIndexes[key]
+
+def sumAlongRays(values, blockers, lines):
+    '''For every square, the sum of the values along the ray from it in the direction of the lines,
+    up to the edge of the board or the first blocker (inclusive). values and blockers are flat arrays
+    as kept by NumpyBoard, whose extra square must hold 0 and True.'''
+    length = lines.shape[1]
+    sums = np.cumsum(values[lines], axis=1)
+    # position of the nearest blocker at or after each position of its line
+    blockerPositions = np.where(blockers[lines], np.arange(length), length - 1)
+    nearest = np.minimum.accumulate(blockerPositions[:, ::-1], axis=1)[:, ::-1]
+    # the ray from a position ends at the nearest blocker after it
+    ends = np.empty_like(nearest)
+    ends[:, :-1] = nearest[:, 1:]
+    ends[:, -1] = length - 1
+    result = np.empty_like(values)
+    result[lines] = np.take_along_axis(sums, ends, axis=1) - sums
+    result[-1] = 0
+    return result
+
+
+class NumpyBoard:
+    '''Board engine that keeps the domain of each piece type as a boolean array over the board.
+
+    Square (x, y) is x * rows + y, followed by one extra square standing for "off the board" (see
+    getBoardIndex), so the squares are visited in the same order as itertools.product(range(cols),
+    range(rows)). Placing a piece only touches the squares it threatens, while scorePossiblePositions
+    scores every square for a piece type at once from sums along the lines of the board.
+    '''
+
+    def __init__(self, cols: int, rows: int, listOfObstacles, maxNumOfEachEnemy, attackTable = None) -> None:
+        self.enemyPos = {}  # (x, y) -> Enemy type
+        self.numberOfEachEnemy = {
+            "King": 0, 
+            "Queen": 0, 
+            "Bishop": 0, 
+            "Rook": 0, 
+            "Knight": 0
+        } 
+        self.obstaclePos = {}
+
+        self.board_size_x = cols
+        self.board_size_y = rows
+        self.maxNumOfEachEnemy = maxNumOfEachEnemy
+        self.trail = []
+        if attackTable == None:
+            attackTable = getAttackTable(cols, rows, listOfObstacles)
+        self.attackTable = attackTable
+        self.lines, self.steps = getBoardIndex(cols, rows)
+
+        self.obstacles = np.zeros(cols * rows + 1, dtype=bool)
+        for x, y in listOfObstacles:
+            self.obstaclePos[(x, y)] = True
+            self.obstacles[self.toIndex(x, y)] = True
+        self.occupied = np.zeros(cols * rows + 1, dtype=bool)
+        self.squares = np.ones(cols * rows + 1, dtype=int)
+        self.squares[-1] = 0
+
+        # remaining candidate squares of each piece type that we are interested in
+        self.domain = {}
+        freeSquares = ~self.obstacles
+        freeSquares[-1] = False
+        for enemy in Piece.enemyTypes:
+            if maxNumOfEachEnemy[enemy] != 0:
+                self.domain[enemy] = freeSquares
+
+        # per piece type, the (xChange, yChange) of the movements that slide and that take one step
+        self.slides = {}
+        self.singleSteps = {}
+        for enemy in Piece.enemyTypes:
+            self.slides[enemy] = [(xChange, yChange) for xChange, yChange, maxSteps in Piece.movement[enemy] if maxSteps == 0]
+            self.singleSteps[enemy] = [(xChange, yChange) for xChange, yChange, maxSteps in Piece.movement[enemy] if maxSteps == 1]
+
+    def toIndex(self, x: int, y: int) -> int:
+        return x * self.board_size_y + y
+
+    def getAttackIndexes(self, pieceType: str, x: int, y: int) -> list:
+        '''Squares threatened by the piece, including the first obstacle or enemy piece on each ray'''
+        return [self.toIndex(i, j) for i, j in pieceMovementModel(self, x, y, pieceType).getAllPossibleNewPos()]
+
+    def sumAlongRays(self, values, xChange: int, yChange: int):
+        '''For every square, the sum of the values along the ray from it in the direction, see sumAlongRays'''
+        blockers = self.obstacles | self.occupied
+        blockers[-1] = True
+        if (xChange, yChange) in self.lines:
+            return sumAlongRays(values, blockers, self.lines[(xChange, yChange)])
+        return sumAlongRays(values, blockers, self.lines[(-xChange, -yChange)][:, ::-1])
+
+    def isBlocked(self, x: int, y:int) -> bool:
+        '''Occupied by enemy piece or by obstacle piece'''
+        return ((x, y) in self.obstaclePos) or ((x, y) in self.enemyPos)
+
+    def isOccupiedByEnemyPiece(self, x: int, y: int) -> bool:
+        return (x, y) in self.enemyPos
+
     def isWithinBoard(self, x, y) -> bool:
         if (0 > x or x >= self.board_size_x) or (0 > y or y >= self.board_size_y):
             return False
         return True
 
+    def addEnemyPiece(self, pieceType: str, x: int, y: int) -> None:
+        self.trail.append(("Enemy", x, y, (pieceType, self.occupied, dict(self.domain))))
+
+        # squares threatened by the piece can no longer take any piece
+        # and no other type may be placed where it would threaten the piece
+        threatened = self.getAttackIndexes(pieceType, x, y) + [self.toIndex(x, y)]
+        for otherType in self.domain:
+            domain = self.domain[otherType].copy()
+            domain[threatened] = False
+            if otherType != pieceType:
+                domain[self.getAttackIndexes(otherType, x, y)] = False
+            self.domain[otherType] = domain
+
+        # the arrays are replaced rather than changed, so the trail can keep the old ones
+        self.occupied = self.occupied.copy()
+        self.occupied[self.toIndex(x, y)] = True
+        self.enemyPos[(x, y)] = pieceType
+        self.numberOfEachEnemy[pieceType] += 1
+
+    def getTrailMark(self) -> int:
+        return len(self.trail)
+
+    def undoToMark(self, mark: int) -> list:
+        '''Revert every change made after the mark, most recent first.
+        Returns the positions of the enemy pieces that were removed.'''
+        removed = []
+        while len(self.trail) > mark:
+            change, x, y, value = self.trail.pop()
+            if change == "Type":
+                domain = self.domain[value].copy()
+                domain[self.toIndex(x, y)] = True
+                self.domain[value] = domain
+            else:
+                pieceType, self.occupied, self.domain = value
+                del self.enemyPos[(x, y)]
+                self.numberOfEachEnemy[pieceType] -= 1
+                removed.append((x, y))
+        return removed
+
+    def removeCandidate(self, pieceType: str, x: int, y: int) -> None:
+        '''Rule out the piece type at an unoccupied position until the trail is undone past this point'''
+        if not self.isPossible(pieceType, x, y):
+            return
+        domain = self.domain[pieceType].copy()
+        domain[self.toIndex(x, y)] = False
+        self.domain[pieceType] = domain
+        self.trail.append(("Type", x, y, pieceType))
+
+    def isPossible(self, pieceType: str, x: int, y: int) -> bool:
+        return pieceType in self.domain and bool(self.domain[pieceType][self.toIndex(x, y)])
+
+    def getPossiblePositions(self, pieceType: str) -> list:
+        '''All unoccupied positions where the piece type can still be placed'''
+        if pieceType not in self.domain:
+            return []
+        return [divmod(index, self.board_size_y) for index in np.flatnonzero(self.domain[pieceType]).tolist()]
+
+    def countPossiblePositions(self, pieceType: str) -> int:
+        if pieceType not in self.domain:
+            return 0
+        return int(np.count_nonzero(self.domain[pieceType]))
+
+    def countOpenPositions(self) -> int:
+        '''Number of unoccupied positions that can still take at least one piece type'''
+        if len(self.domain) == 0:
+            return 0
+        return int(np.count_nonzero(np.logical_or.reduce(list(self.domain.values()))))
+
+    def countThreatenedPositions(self, pieceType: str, x: int, y: int) -> int:
+        return len(self.getAttackIndexes(pieceType, x, y))
+
+    def countRemovedCandidates(self, pieceType: str, x: int, y: int) -> int:
+        '''Number of (position, piece type) candidates that placing the piece would remove'''
+        threatened = np.zeros(len(self.occupied), dtype=bool)
+        threatened[self.getAttackIndexes(pieceType, x, y) + [self.toIndex(x, y)]] = True
+        count = 0
+        for otherType in self.domain:
+            removed = threatened
+            if otherType != pieceType:
+                removed = threatened.copy()
+                removed[self.getAttackIndexes(otherType, x, y)] = True
+            count += int(np.count_nonzero(self.domain[otherType] & removed))
+        return count
+
+    def scorePossiblePositions(self, pieceType: str, valueOrdering: str) -> list:
+        '''(score, position) of every position where the piece type can still be placed, scored as
+        countRemovedCandidates does, or as countThreatenedPositions does for the "least-threatening"
+        ordering, with one pass of array operations over the whole board.
+
+        The squares a piece threatens in a direction are the ones along the ray up to the first blocker
+        for a sliding movement, or the square one step away, so the candidates placing it would remove
+        add up over the directions: its own candidates along its own rays, and for the other types the
+        candidates along their rays beyond the squares its own rays cover.'''
+        if valueOrdering == "least-threatening":
+            scores = np.zeros(len(self.occupied), dtype=int)
+            for xChange, yChange in self.slides[pieceType]:
+                scores += self.sumAlongRays(self.squares, xChange, yChange)
+            for xChange, yChange in self.singleSteps[pieceType]:
+                scores += self.squares[self.steps[(xChange, yChange)]]
+        else:
+            candidates = sum([domain.astype(int) for domain in self.domain.values()])
+            scores = candidates.copy()
+            directions = {}
+            for otherType in self.domain:
+                for xChange, yChange in self.slides[otherType] + self.singleSteps[otherType]:
+                    directions[(xChange, yChange)] = True
+            for direction in list(self.slides[pieceType]) + list(self.singleSteps[pieceType]):
+                directions[direction] = True
+
+            for direction in directions:
+                # candidates of the other types along their rays in the direction
+                slidingCandidates = 0
+                steppingCandidates = 0
+                for otherType in self.domain:
+                    if otherType == pieceType:
+                        continue
+                    if direction in self.slides[otherType]:
+                        slidingCandidates = slidingCandidates + self.domain[otherType]
+                    elif direction in self.singleSteps[otherType]:
+                        steppingCandidates = steppingCandidates + self.domain[otherType]
+
+                if direction in self.slides[pieceType]:
+                    slidingWeights, steppingWeights = candidates, 0
+                elif direction in self.singleSteps[pieceType]:
+                    # the first square of the rays is covered by the piece's own step
+                    slidingWeights, steppingWeights = slidingCandidates, candidates - slidingCandidates
+                else:
+                    slidingWeights, steppingWeights = slidingCandidates, steppingCandidates
+                if not isinstance(slidingWeights, int):
+                    scores += self.sumAlongRays(slidingWeights.astype(int), *direction)
+                if not isinstance(steppingWeights, int):
+                    scores += steppingWeights.astype(int)[self.steps[direction]]
+
+        indexes = np.flatnonzero(self.domain.get(pieceType, np.zeros(len(self.occupied), dtype=bool)))
+        return [(score, divmod(index, self.board_size_y)) for index, score in zip(indexes.tolist(), scores[indexes].tolist())]
+
+    def countLineCapacity(self, pieceType: str, movements) -> int:
+        '''Number of free line segments in each of the directions that hold a candidate for the piece type,
+        the least over the directions, see State.countLineCapacity'''
+        domain = self.domain[pieceType]
+        capacity = int(np.count_nonzero(domain))
+        blockers = self.obstacles | self.occupied
+        blockers[-1] = True
+        for xChange, yChange, _ in movements:
+            lines = self.lines[(xChange, yChange)] if (xChange, yChange) in self.lines else self.lines[(-xChange, -yChange)]
+            # number each segment by the blockers before it on its line, and the lines apart from each other
+            segments = np.cumsum(blockers[lines], axis=1) + np.arange(len(lines))[:, None] * (lines.shape[1] + 1)
+            capacity = min(capacity, len(np.unique(segments[domain[lines]])))
+        return capacity
+
+
+BOARD_ENGINES = {"dict": Board, "bitboard": BitBoard, "numpy": NumpyBoard}
+
 
 class pieceMovementModel():
 
@@ -112,127 +849,261 @@ class pieceMovementModel():
     def moveToDirection(self, x_change: int, y_change: int):
         return (self.x + x_change, self.y + y_change)
 
-    def __getAllPossibleMovementToDirection(self, x_change: int, y_change: int, max_steps=0, f = None):
+    def __getAllPossibleMovementToDirection(self, movement, f = None):
         '''Get all the positions that the piece can move to, including position that are being threatened by other pieces'''
-        if max_steps == 0:
-            max_steps = max(self.board.board_size_x, self.board.board_size_y)
-        
+        # the ray already stops at the first obstacle, only enemy pieces can cut it shorter
+        enemyPos = self.board.enemyPos
         if f == None:
             steps = []
-            for i in range(max_steps):
-                new_pos = self.moveToDirection((i+1) * x_change, (i+1) * y_change)
-                if (not self.board.isWithinBoard(new_pos[0], new_pos[1])):
-                    break
-                if self.board.isBlocked(new_pos[0], new_pos[1]):
+            for new_pos in self.board.attackTable[movement][self.x][self.y]:
+                steps.append(new_pos)
+                if new_pos in enemyPos:
                     # in the context of CSP, the piece violates constraints
-                    # print("ERROR: CONSTRAINT VIOLATION", new_pos[0], new_pos[1])
-                    steps.append(new_pos)
                     break
-                steps.append(new_pos)
             return steps
         else:
-            for i in range(max_steps):
-                new_pos = self.moveToDirection((i+1) * x_change, (i+1) * y_change)
-                if (not self.board.isWithinBoard(new_pos[0], new_pos[1])):
-                    break
-                if self.board.isBlocked(new_pos[0], new_pos[1]):
-                    f(new_pos[0], new_pos[1])
-                    break
+            for new_pos in self.board.attackTable[movement][self.x][self.y]:
                 f(new_pos[0], new_pos[1])
+                if new_pos in enemyPos:
+                    break
 
     def getAllPossibleNewPos(self, f = None):
         if f == None :
             steps = []
             for movement in self.movements:
-                xChange, yChange, maxSteps = movement
-                steps.extend(self.__getAllPossibleMovementToDirection(xChange, yChange, maxSteps))
+                steps.extend(self.__getAllPossibleMovementToDirection(movement))
             return steps
         else:
             for movement in self.movements:
-                xChange, yChange, maxSteps = movement
-                self.__getAllPossibleMovementToDirection(xChange, yChange, maxSteps, f)
+                self.__getAllPossibleMovementToDirection(movement, f)
     
-    def __countAllPossibleMovementToDirection(self, x_change: int, y_change: int, max_steps=0):
-        '''Get all the positions that the piece can move to, including position that are being threatened by other pieces'''
-        if max_steps == 0:
-            max_steps = max(self.board.board_size_x, self.board.board_size_y)
+    def __countAllPossibleMovementToDirection(self, movement):
+        '''Count all the positions that the piece can move to, including position that are being threatened by other pieces'''
+        enemyPos = self.board.enemyPos
         count = 0
-        for i in range(max_steps):
-            new_pos = self.moveToDirection((i+1) * x_change, (i+1) * y_change)
-            if (not self.board.isWithinBoard(new_pos[0], new_pos[1])):
-                break
-            if self.board.isBlocked(new_pos[0], new_pos[1]):
-                count += 1
-                break
+        for new_pos in self.board.attackTable[movement][self.x][self.y]:
             count += 1
+            if new_pos in enemyPos:
+                break
         return count
 
     def countAllPossibleNewPos(self):
         count = 0
         for movement in self.movements:
-            xChange, yChange, maxSteps = movement
-            count += self.__countAllPossibleMovementToDirection(xChange, yChange, maxSteps)
+            count += self.__countAllPossibleMovementToDirection(movement)
         return count
 
-    def __checkThreatenDirectional(self, x_change: int, y_change: int, max_steps=0) -> bool:
-        '''Get all the positions that the piece can move to, including position that are being threatened by other pieces'''
-        if max_steps == 0:
-            max_steps = max(self.board.board_size_x, self.board.board_size_y)
-        
-        for i in range(max_steps):
-            new_pos = self.moveToDirection((i+1) * x_change, (i+1) * y_change)
-            if (not self.board.isWithinBoard(new_pos[0], new_pos[1])):
-                break
-            if self.board.isBlocked(new_pos[0], new_pos[1]):
-                if self.board.isOccupiedByEnemyPiece(new_pos[0], new_pos[1]):
-                    return True
-                break
+    def __checkThreatenDirectional(self, movement) -> bool:
+        '''Check if the first piece along the direction is an enemy piece'''
+        enemyPos = self.board.enemyPos
+        for new_pos in self.board.attackTable[movement][self.x][self.y]:
+            if new_pos in enemyPos:
+                return True
         return False
 
     def checkThreaten(self) -> bool:
         for movement in self.movements:
-            xChange, yChange, maxSteps = movement
-            if self.__checkThreatenDirectional(xChange, yChange, maxSteps):
+            if self.__checkThreatenDirectional(movement):
                 return True
         return False
 
+class SearchStats:
+    '''Counters and phase timings of the backtracking searches of a State, kept only when INSTRUMENT is set.
+    Timing wraps the functions it times, so a search without statistics runs the usual code.'''
+
+    TIMED = ["selectUnassignedVariable", "orderDomainValues", "addEnemyPiece"]
+
+    def __init__(self) -> None:
+        self.backtracks = 0  # values whose subtree failed
+        self.inferenceFailures = 0
+        self.boundFailures = {}  # piece type ("all" for the open positions) -> failed checks of its bound
+        self.domainWipeouts = {}  # piece type -> failed checks that left it no candidates at all
+        self.seconds = {name: 0.0 for name in SearchStats.TIMED}
+        self.calls = {name: 0 for name in SearchStats.TIMED}
+
+    def timed(self, function, name: str):
+        def timedFunction(*args):
+            startTime = perf_counter()
+            result = function(*args)
+            self.seconds[name] += perf_counter() - startTime
+            self.calls[name] += 1
+            return result
+        return timedFunction
+
+    def timedValues(self, values):
+        '''Time the values drawn from orderDomainValues, which does its work as they are drawn'''
+        while True:
+            startTime = perf_counter()
+            value = next(values, None)
+            self.seconds["orderDomainValues"] += perf_counter() - startTime
+            self.calls["orderDomainValues"] += 1
+            if value == None:
+                return
+            yield value
+
+    def instrument(self, board) -> None:
+        if "addEnemyPiece" not in board.__dict__:
+            board.addEnemyPiece = self.timed(board.addEnemyPiece, "addEnemyPiece")
+
+    def countInferenceFailure(self, csp) -> None:
+        self.inferenceFailures += 1
+        failedType = "all" if csp.failedType == None else csp.failedType
+        self.boundFailures[failedType] = self.boundFailures.get(failedType, 0) + 1
+        if csp.failedType != None and csp.board.countPossiblePositions(csp.failedType) == 0:
+            self.domainWipeouts[failedType] = self.domainWipeouts.get(failedType, 0) + 1
+
+    def merge(self, other) -> None:
+        '''Add the statistics of another search, such as one of a region of the board'''
+        self.backtracks += other.backtracks
+        self.inferenceFailures += other.inferenceFailures
+        for counts, otherCounts in [(self.boundFailures, other.boundFailures), (self.domainWipeouts, other.domainWipeouts)]:
+            for pieceType, count in otherCounts.items():
+                counts[pieceType] = counts.get(pieceType, 0) + count
+        for name in SearchStats.TIMED:
+            self.seconds[name] += other.seconds[name]
+            self.calls[name] += other.calls[name]
+
+    def toDict(self) -> dict:
+        return {"backtracks": self.backtracks, "inferenceFailures": self.inferenceFailures,
+                "boundFailures": self.boundFailures, "domainWipeouts": self.domainWipeouts,
+                "seconds": self.seconds, "calls": self.calls}
+
+def writeTrace(record: dict) -> None:
+    '''Append a record to TRACE_PATH as a JSON line'''
+    if TRACE_PATH == None:
+        return
+    with open(TRACE_PATH, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
 class State:
 
-    def __init__(self, rows, cols, listOfObstacles, maxNumberOfEachEnemies) -> None:
-        self.board = Board(cols, rows, listOfObstacles, maxNumberOfEachEnemies)
+    def __init__(self, rows, cols, listOfObstacles, maxNumberOfEachEnemies, engine = None) -> None:
+        if engine == None:
+            engine = BOARD_ENGINE
+            if np != None and NUMPY_MIN_SQUARES != None and cols * rows >= NUMPY_MIN_SQUARES:
+                engine = "numpy"
+        self.engine = engine
+        self.attackTable = getAttackTable(cols, rows, listOfObstacles)
+        self.board = BOARD_ENGINES[engine](cols, rows, listOfObstacles, maxNumberOfEachEnemies, self.attackTable)
         self.rows = rows
         self.cols = cols
         self.listOfObstacles = listOfObstacles
         self.maxNumberOfEachEnemies = maxNumberOfEachEnemies
+        # piece types of the instance, the ones with no pieces to place left out
+        self.enemyTypes = [pieceType for pieceType in Piece.enemyTypes if maxNumberOfEachEnemies[pieceType] != 0]
+        self.symmetries = findSymmetries(cols, rows, listOfObstacles)
+
+        # search heuristics, see selectUnassignedVariable and orderDomainValues
+        self.variableOrdering = "fewest-positions"
+        self.valueOrdering = "least-constraining"
+        self.random = None  # random.Random used to break ties between values, if any
+
+        self.nodesExpanded = 0
+        self.bestPartial = {}  # largest consistent partial assignment reached, returned if the search is stopped
+        self.stats = SearchStats() if INSTRUMENT else None
+        # callable polled at every node or step of the search, which gives up once it returns True. A node
+        # takes tens of microseconds on small boards and far longer on large ones, against well under a
+        # microsecond for reading the clock, so polling every node keeps deadlines tight for free.
+        self.stopCondition = None
+
+        # piece type whose check made the last call to inference fail, None if it was the check on all the pieces
+        self.failedType = None
+
+    def copy(self):
+        '''Unsolved state of the same instance with the same search settings, so that searching it
+        leaves this one untouched'''
+        newCopy = State(self.rows, self.cols, list(self.listOfObstacles), dict(self.maxNumberOfEachEnemies), self.engine)
+        newCopy.variableOrdering = self.variableOrdering
+        newCopy.valueOrdering = self.valueOrdering
+        newCopy.random = self.random
+        newCopy.stopCondition = self.stopCondition
+        return newCopy
         
-    def setAssignment(self, assignment: dict):
-        self.board = Board(self.cols, self.rows, self.listOfObstacles, self.maxNumberOfEachEnemies)
-        for pos in assignment:
-            self.board.addEnemyPiece(assignment[pos], pos[0], pos[1])
-    
     def updateAssignment(self, enemyType: str, position: tuple):
         self.board.addEnemyPiece(enemyType, position[0], position[1])
 
+    def undoAssignment(self, mark: int):
+        '''Revert the pieces placed and values excluded since the board's trail was at the mark'''
+        self.board.undoToMark(mark)
+
+    def getStabilizer(self) -> list:
+        '''Symmetries of the board that map the current enemy pieces onto themselves'''
+        stabilizer = []
+        enemyPos = self.board.enemyPos
+        for symmetry in self.symmetries:
+            for (x, y), pieceType in enemyPos.items():
+                if enemyPos.get(symmetry[x][y]) != pieceType:
+                    break
+            else:
+                stabilizer.append(symmetry)
+        return stabilizer
+
+    def isSymmetricState(self, symmetry) -> bool:
+        '''Whether the symmetry maps the candidates of every piece type onto themselves'''
+        for x, y in itertools.product(range(self.cols), range(self.rows)):
+            imageX, imageY = symmetry[x][y]
+            for pieceType in self.maxNumberOfEachEnemies:
+                if self.board.isPossible(pieceType, x, y) != self.board.isPossible(pieceType, imageX, imageY):
+                    return False
+        return True
+
+    def excludeValue(self, enemyType: str, position: tuple, stabilizer: list):
+        '''Rule out a value whose subtree has been fully explored, together with its images under
+        the symmetries that fix the current pieces, until the board's trail is undone past this point'''
+        x, y = position
+        self.board.removeCandidate(enemyType, x, y)
+        for symmetry in stabilizer:
+            imageX, imageY = symmetry[x][y]
+            self.board.removeCandidate(enemyType, imageX, imageY)
+
     def inference(self) -> bool:
-        # print(np.array([[len(x) for x in row] for row in self.board.possibleEnemyTypes]))
-        remainingPiecesCount = sum([self.maxNumberOfEachEnemies[pieceType] for pieceType in Piece.enemyTypes]) - len(self.board.enemyPos)
-        # print("remaining pieces", remainingPiecesCount)
-
-        # check if threatening each other
-        # for pos in self.board.enemyPos:
-        #     movements = pieceMovementModel(self.board, pos[0], pos[1], self.board.enemyPos[pos])
-        #     if movements.checkThreaten():
-        #         return False
-
-        remainingPositionsCount = 0
-        for x, y in list(itertools.product(range(self.cols), range(self.rows))):
-            if self.board.isBlocked(x, y):
+        remainingPiecesCount = sum([self.maxNumberOfEachEnemies[pieceType] for pieceType in self.enemyTypes]) - len(self.board.enemyPos)
+
+        remainingPositionsCount = self.board.countOpenPositions()
+        if remainingPositionsCount < remainingPiecesCount:
+            self.failedType = None
+            return False
+
+        # forward checking: every piece type needs room for the pieces it has yet to place
+        for pieceType in self.enemyTypes:
+            remaining = self.maxNumberOfEachEnemies[pieceType] - self.board.numberOfEachEnemy[pieceType]
+            if remaining != 0 and self.board.countPossiblePositions(pieceType) < remaining:
+                self.failedType = pieceType
+                return False
+
+        # pieces of the same type cannot share a free line segment
+        for pieceType in Piece.lines:
+            if pieceType not in self.enemyTypes:
                 continue
-            if len(self.board.possibleEnemyTypes[x][y]) != 0:
-                remainingPositionsCount += 1
-        if remainingPositionsCount >= remainingPiecesCount:
-            return True
-        return False
+            remaining = self.maxNumberOfEachEnemies[pieceType] - self.board.numberOfEachEnemy[pieceType]
+            if remaining >= 2 and self.countLineCapacity(pieceType) < remaining:
+                self.failedType = pieceType
+                return False
+        return True
+
+    def countLineCapacity(self, pieceType: str) -> int:
+        '''Upper bound on the number of pieces of the type that can still be placed.
+
+        Two such pieces on the same line segment between obstacles or enemy pieces would threaten
+        each other, and a piece placed later between them would be threatened by both, so each
+        free segment of each line direction takes at most one of them.'''
+        if self.engine == "numpy":
+            return self.board.countLineCapacity(pieceType, Piece.lines[pieceType])
+        positions = self.board.getPossiblePositions(pieceType)
+        capacity = len(positions)
+        enemyPos = self.board.enemyPos
+        for movement in Piece.lines[pieceType]:
+            rays = self.attackTable[movement]
+            segments = {}
+            for x, y in positions:
+                # a segment is identified by the square that ends it in this direction
+                end = (x, y)
+                for end in rays[x][y]:
+                    if end in enemyPos:
+                        break
+                segments[end] = True
+            capacity = min(capacity, len(segments))
+        return capacity
 
     def setBoard(self, board: Board) -> None:
         self.board = board
@@ -249,10 +1120,21 @@ def XYtoPos(xy: tuple) -> tuple:
 
 def parser(testfile):
     f = open(testfile, "r")
+    text = f.read()
+    f.close()
+    return parseText(text)
+
+def parseText(text: str):
+    '''State of the instance described by the text of a test file'''
+    rows, cols, listOfObstacles, numOfEachEnemies = parseInstance(text)
+    return State(rows, cols, listOfObstacles, numOfEachEnemies)
+
+def parseInstance(text: str) -> tuple:
+    '''(rows, cols, obstacles, number of each enemy) of the instance described by the text of a test file'''
+    lines = iter(text.splitlines())
 
     def input():
-        line = f.readline().strip("\n")
-        return line
+        return next(lines, "")
 
     rows = int(input().split(":")[1])
     cols = int(input().split(":")[1])
@@ -277,16 +1159,163 @@ def parser(testfile):
             "Rook": int(numOfEachEnemiesList[3]), 
             "Knight": int(numOfEachEnemiesList[4])
         } 
-    
-    # remove enemyType if is not in the csp
-    for enemyType in numOfEachEnemies:
-        if numOfEachEnemies[enemyType] == 0:
-            Piece.enemyTypes.remove(enemyType)
-    
-    f.close()
 
-    csp = State(rows, cols, listOfObstacles, numOfEachEnemies)
-    return csp
+    return (rows, cols, listOfObstacles, numOfEachEnemies)
+
+LINE_DIRECTIONS = [(1, 0), (0, -1), (-1, 0), (0, 1), (1, 1), (1, -1), (-1, -1), (-1, 1)]
+
+class ConflictBoard:
+    '''Complete placement of the pieces for the min-conflicts search.
+
+    For every line direction and square it keeps the nearest piece in that direction, so the
+    number of pieces a piece at a square is in conflict with is found without walking rays,
+    and moving a piece only updates the line segments through its old and new squares.'''
+
+    def __init__(self, csp: State) -> None:
+        self.attackTable = csp.attackTable
+        self.pieces = {}  # (x, y) -> piece type
+        self.freePositions = []
+        obstacles = set(csp.listOfObstacles)
+        for x, y in itertools.product(range(csp.cols), range(csp.rows)):
+            if (x, y) not in obstacles:
+                self.freePositions.append((x, y))
+
+        # direction -> 2D array of the position of the nearest piece in that direction, or None
+        self.nearest = {}
+        for direction in LINE_DIRECTIONS:
+            self.nearest[direction] = [[None] * csp.rows for _ in range(csp.cols)]
+        self.numOfKnightsAttacking = [[0] * csp.rows for _ in range(csp.cols)]
+
+        # piece type -> direction -> how far the piece threatens along it (0 if it does not)
+        self.reach = {}
+        for pieceType in Piece.movement:
+            self.reach[pieceType] = {}
+            for direction in LINE_DIRECTIONS:
+                self.reach[pieceType][direction] = 0
+            for xChange, yChange, maxSteps in Piece.movement[pieceType]:
+                if (xChange, yChange) in self.reach[pieceType]:
+                    self.reach[pieceType][(xChange, yChange)] = maxSteps if maxSteps != 0 else max(csp.cols, csp.rows)
+
+    def addPiece(self, pieceType: str, x: int, y: int) -> None:
+        # (x, y) becomes the nearest piece for the squares behind it, up to the next piece
+        for xChange, yChange in LINE_DIRECTIONS:
+            nearest = self.nearest[(xChange, yChange)]
+            for position in self.attackTable[(-xChange, -yChange, 0)][x][y]:
+                nearest[position[0]][position[1]] = (x, y)
+                if position in self.pieces:
+                    break
+        if pieceType == "Knight":
+            for movement in Piece.movement["Knight"]:
+                for i, j in self.attackTable[movement][x][y]:
+                    self.numOfKnightsAttacking[i][j] += 1
+        self.pieces[(x, y)] = pieceType
+
+    def removePiece(self, x: int, y: int) -> str:
+        pieceType = self.pieces.pop((x, y))
+        # the squares behind (x, y) now see the piece that (x, y) saw
+        for xChange, yChange in LINE_DIRECTIONS:
+            nearest = self.nearest[(xChange, yChange)]
+            replacement = nearest[x][y]
+            for position in self.attackTable[(-xChange, -yChange, 0)][x][y]:
+                nearest[position[0]][position[1]] = replacement
+                if position in self.pieces:
+                    break
+        if pieceType == "Knight":
+            for movement in Piece.movement["Knight"]:
+                for i, j in self.attackTable[movement][x][y]:
+                    self.numOfKnightsAttacking[i][j] -= 1
+        return pieceType
+
+    def countConflicts(self, pieceType: str, x: int, y: int) -> int:
+        '''Number of pieces that a piece of the type at (x, y) would threaten or be threatened by'''
+        count = 0
+        for xChange, yChange in LINE_DIRECTIONS:
+            other = self.nearest[(xChange, yChange)][x][y]
+            if other == None:
+                continue
+            distance = max(abs(other[0] - x), abs(other[1] - y))
+            if self.reach[pieceType][(xChange, yChange)] >= distance or (
+                self.reach[self.pieces[other]][(-xChange, -yChange)] >= distance):
+                count += 1
+
+        # knights attacking (x, y), and the other pieces a knight at (x, y) would attack
+        count += self.numOfKnightsAttacking[x][y]
+        if pieceType == "Knight":
+            for movement in Piece.movement["Knight"]:
+                for position in self.attackTable[movement][x][y]:
+                    if position in self.pieces and self.pieces[position] != "Knight":
+                        count += 1
+        return count
+
+    def getBestPositions(self, pieceType: str) -> tuple:
+        '''Free positions with the fewest conflicts for the piece type, and that number of conflicts'''
+        bestCount = None
+        bestPositions = []
+        for x, y in self.freePositions:
+            if (x, y) in self.pieces:
+                continue
+            count = self.countConflicts(pieceType, x, y)
+            if bestCount == None or count < bestCount:
+                bestCount = count
+                bestPositions = [(x, y)]
+            elif count == bestCount:
+                bestPositions.append((x, y))
+        return bestPositions, bestCount
+
+    def getConflictedPieces(self) -> tuple:
+        '''Positions of the pieces in conflict, and the number of pairs of pieces in conflict'''
+        conflicted = []
+        total = 0
+        for (x, y), pieceType in self.pieces.items():
+            count = self.countConflicts(pieceType, x, y)
+            if count != 0:
+                conflicted.append((x, y))
+                total += count
+        return conflicted, total // 2
+
+def minConflicts(csp: State, maxSteps: int = None):
+    '''Place every piece, then repeatedly move a piece in conflict to the position with the fewest
+    conflicts, restarting when the number of conflicts stops improving.
+    Returns the assignment, or None if no solution was found within maxSteps moves.'''
+    if maxSteps == None:
+        maxSteps = MIN_CONFLICTS_MAX_STEPS
+    rng = csp.random if csp.random != None else random.Random()
+    pieceTypes = []
+    for pieceType, maxNum in csp.maxNumberOfEachEnemies.items():
+        pieceTypes += [pieceType] * maxNum
+
+    steps = 0
+    while steps < maxSteps:
+        board = ConflictBoard(csp)
+        if len(pieceTypes) > len(board.freePositions):
+            return None
+
+        # start from a greedy placement
+        rng.shuffle(pieceTypes)
+        for pieceType in pieceTypes:
+            positions, _ = board.getBestPositions(pieceType)
+            board.addPiece(pieceType, *rng.choice(positions))
+
+        lowestConflicts = None
+        stepsSinceImprovement = 0
+        while steps < maxSteps and stepsSinceImprovement < MIN_CONFLICTS_PLATEAU_STEPS:
+            conflicted, numOfConflicts = board.getConflictedPieces()
+            if numOfConflicts == 0:
+                return dict(board.pieces)
+            if lowestConflicts == None or numOfConflicts < lowestConflicts:
+                lowestConflicts = numOfConflicts
+                stepsSinceImprovement = 0
+            else:
+                stepsSinceImprovement += 1
+
+            steps += 1
+            if csp.stopCondition != None and csp.stopCondition():
+                return None
+            x, y = rng.choice(conflicted)
+            pieceType = board.removePiece(x, y)
+            positions, _ = board.getBestPositions(pieceType)
+            board.addPiece(pieceType, *rng.choice(positions))
+    return None
 
 class Assignment:
 
@@ -295,21 +1324,11 @@ class Assignment:
         self.maxNumOfEachEnemy = maxNumOfEachEnemy
         self.currentNumOfEachEnemy = {}
         self.assignment = {}
-        self.checked = {}
-        for enemyType in Piece.enemyTypes:
+        for enemyType in maxNumOfEachEnemy:
             self.currentNumOfEachEnemy[enemyType] = 0
-            self.checked[enemyType] = {}
 
-    def copy(self):
-        newCopy = Assignment(self.maxNumOfEachEnemy)
-        for position in self.assignment:
-            newCopy.addAssignment(self.assignment[position], position)
-        for enemyType in Piece.enemyTypes:
-            newCopy.checked[enemyType] = self.checked[enemyType].copy()
-        return newCopy
-    
     def isComplete(self) -> bool:
-        for enemyType in Piece.enemyTypes:
+        for enemyType in self.maxNumOfEachEnemy:
             if self.currentNumOfEachEnemy[enemyType] != self.maxNumOfEachEnemy[enemyType]:
                 return False
         return True
@@ -317,7 +1336,6 @@ class Assignment:
     def addAssignment(self, enemyType: str, position: tuple):
         self.currentNumOfEachEnemy[enemyType] += 1
         self.assignment[position] = enemyType
-        self.checked[enemyType][position] = True
     
     def removeAssignment(self, enemyType: str, position: tuple):
         self.currentNumOfEachEnemy[enemyType] -= 1
@@ -327,11 +1345,12 @@ class Assignment:
         return position in list(self.assignment.keys())
 
 def selectUnassignedVariable(csp: State, assignment: Assignment):
-    '''Select the piece type that has the least number of available positions'''
+    '''Select the piece type that has the least number of available positions,
+    or the least per piece still to place for the "fewest-per-piece" ordering'''
 
     remainingTypes = []
     # for all remaining piece types that are yet to be assigned
-    for pieceType in Piece.enemyTypes:
+    for pieceType in csp.enemyTypes:
         if assignment.currentNumOfEachEnemy[pieceType] == assignment.maxNumOfEachEnemy[pieceType]:
             continue
         remainingTypes.append(pieceType)
@@ -341,71 +1360,711 @@ def selectUnassignedVariable(csp: State, assignment: Assignment):
     minimumType = None
     for pieceType in remainingTypes:
         # count the number of positions that has this piece type 
-        count = 0
-        
-        skip = False
-        for x, y in list(itertools.product(range(csp.cols), range(csp.rows))):
-            if pieceType in csp.board.possibleEnemyTypes[x][y]:
-                count += 1
-                if count > minimumCount:
-                    skip = True
-                    break
-        
-        if skip:
+        count = csp.board.countPossiblePositions(pieceType)
+        if csp.variableOrdering == "fewest-per-piece":
+            count = count / (assignment.maxNumOfEachEnemy[pieceType] - assignment.currentNumOfEachEnemy[pieceType])
+        if count > minimumCount:
             continue
 
-        if count == 1:
+        if count <= 1:
             return pieceType
         
         minimumType = pieceType
         minimumCount = count
     return minimumType
 
-def orderDomainValues(csp: State, pieceType: str, assignment: Assignment):
-    '''Order the positions in increasing number of positions threatened by the piece'''
+def orderDomainValues(csp: State, pieceType: str):
+    '''Yield the positions in increasing number of candidates that placing the piece would remove,
+    or in increasing number of positions threatened for the "least-threatening" ordering'''
 
-    result = []
-    # for all position
-    for x, y in list(itertools.product(range(csp.cols), range(csp.rows))):
-        if (x, y) in csp.board.enemyPos or (
-            pieceType not in csp.board.possibleEnemyTypes[x][y]) or (
-            (x, y) in assignment.checked[pieceType]):
-            continue
-        transModel = pieceMovementModel(csp.board, x, y, pieceType)
-        # add the number of positions threatened by the piece at that position to the list
-        result.append((transModel.countAllPossibleNewPos(), (x, y)))
+    if csp.engine == "numpy":
+        # array operations score every value at once
+        scored = csp.board.scorePossiblePositions(pieceType, csp.valueOrdering)
+    else:
+        scored = []
+        for x, y in csp.board.getPossiblePositions(pieceType):
+            if csp.valueOrdering == "least-threatening":
+                score = csp.board.countThreatenedPositions(pieceType, x, y)
+            else:
+                score = csp.board.countRemovedCandidates(pieceType, x, y)
+            scored.append((score, (x, y)))
 
-    result.sort()
-    return result
+    heap = []
+    for score, position in scored:
+        tieBreak = csp.random.random() if csp.random != None else 0
+        heap.append((score, tieBreak, position))
+
+    # only pop as many values as the search asks for instead of sorting all of them
+    heapq.heapify(heap)
+    while len(heap) != 0:
+        score, _, (x, y) = heapq.heappop(heap)
+        # skip values ruled out after the heap was built
+        if csp.board.isPossible(pieceType, x, y):
+            yield score, (x, y)
+
+def newFrame(csp: State, enemyType: str) -> list:
+    values = orderDomainValues(csp, enemyType)
+    if csp.stats != None:
+        values = csp.stats.timedValues(values)
+    return [enemyType, values, csp.board.getTrailMark(), None, None, None]
 
 def backTrack(csp: State, assignment: Assignment):
-    # print("current assignment", assignment.assignment)
-    # input()
-    # print("-"*80)
-    enemyType = selectUnassignedVariable(csp, assignment)
-    for _, position in orderDomainValues(csp, enemyType, assignment):
+    '''Depth first search over the piece placements, driven by an explicit stack of frames
+    so that the depth is not limited by Python's recursion limit.
+    Returns the assignment if one is found, False if there is none, or None if csp.stopCondition stopped it.'''
+    if assignment.isComplete():
+        return assignment.assignment
+
+    # frame: [piece type, iterator over its values, trail mark on entering the level,
+    #         stabilizer of the pieces above the level, trail mark before the current value, current value]
+    stats = csp.stats
+    selectVariable = selectUnassignedVariable
+    if stats != None:
+        selectVariable = stats.timed(selectUnassignedVariable, "selectUnassignedVariable")
+        stats.instrument(csp.board)
+    stack = [newFrame(csp, selectVariable(csp, assignment))]
+    while len(stack) != 0:
+        frame = stack[-1]
+        enemyType, values, levelMark, stabilizer, mark, position = frame
+
+        if position != None:
+            # the subtree of the current value failed
+            assignment.removeAssignment(enemyType, position)
+            csp.undoAssignment(mark)
+            if stats != None:
+                stats.backtracks += 1
+
+            # no solution has this value, so the sibling subtrees can skip it and so can the values
+            # it maps to under the symmetries that fix the pieces placed so far. Pieces of the same
+            # type are interchangeable, so this also stops the same set of positions from being
+            # tried again in a different order.
+            if stabilizer == None:
+                stabilizer = frame[3] = csp.getStabilizer()
+            csp.excludeValue(enemyType, position, stabilizer)
+            frame[5] = None
+
+        value = next(values, None)
+        if value == None:
+            # the exclusions only hold below this level
+            csp.undoAssignment(levelMark)
+            stack.pop()
+            continue
+
+        csp.nodesExpanded += 1
+        if csp.stopCondition != None and csp.stopCondition():
+            return None
+
+        _, position = value
+        frame[4] = csp.board.getTrailMark()
+        frame[5] = position
         assignment.addAssignment(enemyType, position)
         csp.updateAssignment(enemyType, position)
+        if len(assignment.assignment) > len(csp.bestPartial):
+            csp.bestPartial = dict(assignment.assignment)
         
         if assignment.isComplete():
-            # print(assignment.assignment)
             return assignment.assignment
 
-        inference = csp.inference()
-        if inference != False:
-            result = backTrack(csp, assignment.copy())
-            if result != False:
-                return result
-        assignment.removeAssignment(enemyType, position)
-        csp.setAssignment(assignment.assignment)
-        # print("Backtrack to", assignment.assignment)
+        if csp.inference() != False:
+            stack.append(newFrame(csp, selectVariable(csp, assignment)))
+        elif stats != None:
+            stats.countInferenceFailure(csp)
+    return False
+
+
+
+def getOrbitWeight(assignment: dict, orbits: list):
+    '''Weight of a solution counted through the representatives of the orbits it was reached by.
+
+    Solutions with a piece of the type somewhere in an orbit are all reached through one of its
+    k positions, as often through each of them by symmetry, and from every position in the orbit
+    that the type occupies, so each is counted k times over that number of positions.'''
+    weight = 1
+    for pieceType, orbit in orbits:
+        count = 0
+        for position in orbit:
+            if assignment.get(position) == pieceType:
+                count += 1
+        weight *= Fraction(len(orbit), count)
+    return weight
+
+def preservesOrbits(symmetry, orbits: list) -> bool:
+    '''Whether the symmetry maps every orbit counted through a representative onto itself.
+
+    Deeper levels may only count through symmetries that keep the weights of the levels above,
+    and a symmetry that swaps two pieces can move an orbit of a level above onto other squares.'''
+    for _, orbit in orbits:
+        for x, y in orbit:
+            if symmetry[x][y] not in orbit:
+                return False
+    return True
+
+def exploreSolutions(csp: State, counting: bool = False):
+    '''Depth first search over every solution, driven by an explicit stack like backTrack.
+
+    Yields each solution as the live assignment dict, which the search goes on changing. With
+    counting it yields numbers of solutions instead: subtrees that a symmetry of the board maps
+    onto each other are explored once, and the last piece is counted without being placed.
+    Once a value has been explored it is excluded from the rest of its level, so every set of
+    positions is reached once. Only the stack is kept, so memory does not grow with the number
+    of solutions.'''
+    assignment = Assignment(csp.maxNumberOfEachEnemies)
+    if assignment.isComplete():
+        yield 1 if counting else assignment.assignment
+        return
+    if csp.inference() == False:
+        return
+
+    # frame: [piece type, iterator over its values, trail mark on entering the level,
+    #         symmetries that fix the state on entering the level, trail mark before the current value,
+    #         current value, whether an orbit was pushed for the current value]
+    orbits = []  # (piece type, positions) of the values standing for their orbit, from the top
+    stack = []
+    enemyType = selectUnassignedVariable(csp, assignment)
+    while True:
+        if enemyType != None:
+            stabilizer = []
+            if counting:
+                stabilizer = [symmetry for symmetry in csp.getStabilizer()
+                              if preservesOrbits(symmetry, orbits) and csp.isSymmetricState(symmetry)]
+            remaining = 0
+            for pieceType in csp.enemyTypes:
+                remaining += assignment.maxNumOfEachEnemy[pieceType] - assignment.currentNumOfEachEnemy[pieceType]
+            if counting and remaining == 1 and len(orbits) == 0:
+                yield csp.board.countPossiblePositions(enemyType)
+            else:
+                stack.append([enemyType, orderDomainValues(csp, enemyType), csp.board.getTrailMark(), stabilizer, None, None, False])
+            enemyType = None
+        if len(stack) == 0:
+            return
+
+        frame = stack[-1]
+        pieceType, values, levelMark, stabilizer, mark, position, hasOrbit = frame
+        if position != None:
+            assignment.removeAssignment(pieceType, position)
+            csp.undoAssignment(mark)
+            # every solution with the value, or with any value of its orbit, has been reached
+            csp.excludeValue(pieceType, position, stabilizer)
+            if hasOrbit:
+                orbits.pop()
+            frame[5] = None
+
+        value = next(values, None)
+        if value == None:
+            csp.undoAssignment(levelMark)
+            stack.pop()
+            continue
+
+        csp.nodesExpanded += 1
+        if csp.stopCondition != None and csp.stopCondition():
+            return
+
+        _, position = value
+        frame[4] = csp.board.getTrailMark()
+        frame[5] = position
+        orbit = {position}
+        for symmetry in stabilizer:
+            orbit.add(symmetry[position[0]][position[1]])
+        frame[6] = len(orbit) > 1
+        if frame[6]:
+            orbits.append((pieceType, orbit))
+        assignment.addAssignment(pieceType, position)
+        csp.updateAssignment(pieceType, position)
+
+        if assignment.isComplete():
+            if not counting:
+                yield assignment.assignment
+            else:
+                yield getOrbitWeight(assignment.assignment, orbits)
+        elif csp.inference() != False:
+            enemyType = selectUnassignedVariable(csp, assignment)
+
+def countSolutions(csp: State) -> int:
+    total = 0
+    for count in exploreSolutions(csp, counting=True):
+        total += count
+    return int(total)
+
+REGION_STEPS = [(1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1)] + Piece.movement["Knight"]
+
+def findRegions(cols: int, rows: int, listOfObstacles) -> list:
+    '''Split the free squares into regions that no piece can threaten across.
+
+    Rays only pass between neighbouring free squares and knights jump over anything, so the
+    regions are the squares connected by king steps and knight jumps.'''
+    obstacles = set(listOfObstacles)
+    regionOf = {}
+    regions = []
+    for start in itertools.product(range(cols), range(rows)):
+        if start in obstacles or start in regionOf:
+            continue
+        region = [start]
+        regionOf[start] = len(regions)
+        frontier = [start]
+        while len(frontier) != 0:
+            x, y = frontier.pop()
+            for step in REGION_STEPS:
+                neighbour = (x + step[0], y + step[1])
+                if not (0 <= neighbour[0] < cols and 0 <= neighbour[1] < rows):
+                    continue
+                if neighbour in obstacles or neighbour in regionOf:
+                    continue
+                regionOf[neighbour] = len(regions)
+                region.append(neighbour)
+                frontier.append(neighbour)
+        regions.append(region)
+    return regions
+
+regionResults = {}  # (region shape, piece types) -> {"solutions": {quotas: placement}, "failures": [quotas], "listed": bool}
+
+class Region:
+    '''Part of the board walled off from the rest, solved on its own for any numbers of pieces.
+
+    Results are shared by every region with the same shape. A region that can take some pieces can
+    take any fewer of them, so known solutions and failures also settle the smaller and larger
+    numbers of pieces. Small regions list a placement for every number of pieces they can take
+    up front, see listPlacements.'''
+
+    def __init__(self, squares: list, pieceTypes: list) -> None:
+        self.offsetX = min([x for x, _ in squares])
+        self.offsetY = min([y for _, y in squares])
+        self.shape = frozenset((x - self.offsetX, y - self.offsetY) for x, y in squares)
+        self.cols = max([x for x, _ in self.shape]) + 1
+        self.rows = max([y for _, y in self.shape]) + 1
+        self.obstacles = []
+        for x, y in itertools.product(range(self.cols), range(self.rows)):
+            if (x, y) not in self.shape:
+                self.obstacles.append((x, y))
+        self.pieceTypes = pieceTypes
+        key = (self.shape, tuple(pieceTypes))
+        if key not in regionResults and len(regionResults) >= MAX_CACHED_BOARDS:
+            del regionResults[next(iter(regionResults))]
+        self.results = regionResults.setdefault(key, {"solutions": {}, "failures": [], "listed": None})
+        self.partial = {}  # largest partial placement of the last search that was stopped
+
+        # bound on the pieces of each type that fit in the region on their own
+        self.capacity = []
+        emptyState = State(self.rows, self.cols, self.obstacles, self.getQuotaDict([len(self.shape)] * len(pieceTypes)))
+        for pieceType in pieceTypes:
+            if pieceType in Piece.lines:
+                self.capacity.append(emptyState.countLineCapacity(pieceType))
+            else:
+                self.capacity.append(len(self.shape))
+
+    def listPlacements(self, parent: State) -> bool:
+        '''Find a placement for every number of pieces of each type that the region can take, in one
+        search over the placements of any pieces, unless the region has more than MAX_LISTED_SQUARES
+        squares or more than MAX_LISTED_PLACEMENTS placements.
+        Returns whether every number the region can take has a placement in the solutions.'''
+        if self.results["listed"] != None:
+            return self.results["listed"]
+        if len(self.shape) > MAX_LISTED_SQUARES:
+            self.results["listed"] = False
+            return False
+        squares = sorted(self.shape)
+        attackTable = getAttackTable(self.cols, self.rows, self.obstacles)
+        solutions = self.results["solutions"]
+        numOfPlacements = 0
+        # frame: (index of the first square left to place on, placement so far)
+        stack = [(0, {})]
+        while len(stack) != 0 and numOfPlacements <= MAX_LISTED_PLACEMENTS:
+            start, placement = stack.pop()
+            numOfPlacements += 1
+            quotas = tuple([list(placement.values()).count(pieceType) for pieceType in self.pieceTypes])
+            solutions.setdefault(quotas, placement)
+            for i in range(start, len(squares)):
+                x, y = squares[i]
+                for pieceType in self.pieceTypes:
+                    if not self.threatensAny(attackTable, x, y, pieceType, placement):
+                        stack.append((i + 1, {**placement, (x, y): pieceType}))
+        parent.nodesExpanded += numOfPlacements
+        self.results["listed"] = len(stack) == 0
+        return self.results["listed"]
+
+    def threatensAny(self, attackTable: dict, x: int, y: int, pieceType: str, placement: dict) -> bool:
+        '''Whether a piece of the type at (x, y) and a piece of the placement would threaten each other'''
+        for movement in Piece.movement[pieceType]:
+            for square in attackTable[movement][x][y]:
+                if square in placement:
+                    return True
+        for (placedX, placedY), placedType in placement.items():
+            for movement in Piece.movement[placedType]:
+                if (x, y) in attackTable[movement][placedX][placedY]:
+                    return True
+        return False
+
+    def getQuotaDict(self, quotas) -> dict:
+        maxNumOfEachEnemy = {}
+        for pieceType in Piece.enemyTypes:
+            maxNumOfEachEnemy[pieceType] = 0
+        for pieceType, quota in zip(self.pieceTypes, quotas):
+            maxNumOfEachEnemy[pieceType] = quota
+        return maxNumOfEachEnemy
+
+    def solve(self, quotas: tuple, parent: State):
+        '''Placement of the numbers of pieces in the region, False if there is none, or None if the
+        stopCondition of the parent, the State of the whole board, stopped the search. The nodes and
+        statistics of the search are added to the parent's.'''
+        solutions = self.results["solutions"]
+        placement = solutions.get(quotas)
+        if placement == None and self.results["listed"]:
+            return False
+        if placement == None:
+            for failed in self.results["failures"]:
+                if all(fewer <= more for fewer, more in zip(failed, quotas)):
+                    return False
+            placement = self.reduceKnownSolution(quotas)
+        if placement == None:
+            maxNumOfEachEnemy = self.getQuotaDict(quotas)
+            csp = State(self.rows, self.cols, self.obstacles, maxNumOfEachEnemy)
+            csp.stopCondition = parent.stopCondition
+            placement = backTrack(csp, Assignment(maxNumOfEachEnemy))
+            parent.nodesExpanded += csp.nodesExpanded
+            if parent.stats != None and csp.stats != None:
+                parent.stats.merge(csp.stats)
+            if placement == None:
+                self.partial = self.translate(csp.bestPartial)
+                return None
+            if placement == False:
+                self.results["failures"].append(quotas)
+                return False
+            solutions[quotas] = dict(placement)
+        elif quotas not in solutions:
+            solutions[quotas] = placement
+        return self.translate(placement)
+
+    def translate(self, placement: dict) -> dict:
+        '''Placement with the region's positions moved to the board's'''
+        translated = {}
+        for (x, y), pieceType in placement.items():
+            translated[(x + self.offsetX, y + self.offsetY)] = pieceType
+        return translated
+
+    def reduceKnownSolution(self, quotas: tuple):
+        '''Drop pieces from a known placement of at least as many pieces of every type'''
+        for known, placement in self.results["solutions"].items():
+            if not all(fewer <= more for fewer, more in zip(quotas, known)):
+                continue
+            remaining = dict(zip(self.pieceTypes, quotas))
+            reduced = {}
+            for position, pieceType in placement.items():
+                if remaining[pieceType] != 0:
+                    remaining[pieceType] -= 1
+                    reduced[position] = pieceType
+            return reduced
+        return None
+
+def getRegionQuotas(region: Region, remaining: tuple, laterCapacity: list):
+    '''Numbers of pieces of each type to try in the region, leaving no more than the later regions
+    can take. Numbers near what a region can take are the ones whose searches fail, and a failure
+    is only found by trying every placement, so the closest to the region's share of the remaining
+    pieces come first, and the fewest pieces among those as close. A region with its placements
+    listed has no searches to fail, so only the numbers it can take are tried and the most pieces
+    come first, leaving the later regions as few as possible.'''
+    ranges = []
+    for i, quota in enumerate(remaining):
+        lowest = max(0, quota - laterCapacity[i])
+        highest = min(quota, region.capacity[i])
+        if lowest > highest:
+            return []
+        ranges.append(range(lowest, highest + 1))
+
+    laterSquares = laterCapacity[-1]
+    share = len(region.shape) / (len(region.shape) + laterSquares)
+    listed = region.results["listed"]
+    candidates = []
+    for quotas in itertools.product(*ranges):
+        total = sum(quotas)
+        if total > len(region.shape) or sum(remaining) - total > laterSquares:
+            continue
+        if listed and quotas not in region.results["solutions"]:
+            continue
+        distance = sum([abs(quota - share * remainingQuota) for quota, remainingQuota in zip(quotas, remaining)])
+        if listed:
+            candidates.append((-total, distance, quotas))
+        else:
+            candidates.append((distance, total, quotas))
+    candidates.sort()
+    return [quotas for _, _, quotas in candidates]
+
+def searchRegions(csp: State):
+    '''Solve the regions walled off from each other separately. They only interact through the
+    numbers of pieces of each type, so a search over how many pieces of each type every region
+    takes combines their placements, remembering the remaining numbers that the later regions
+    cannot take. Boards that are one region are left to backTrack.
+    Returns the assignment, False if there is none, or None if csp.stopCondition stopped it.'''
+    squares = findRegions(csp.cols, csp.rows, csp.listOfObstacles)
+    if len(squares) < 2:
+        return backTrack(csp, Assignment(csp.maxNumberOfEachEnemies))
+
+    pieceTypes = csp.enemyTypes
+    regions = [Region(region, pieceTypes) for region in sorted(squares, key=len)]
+    for region in regions:
+        region.listPlacements(csp)
+
+    # laterCapacity[i]: bound on the pieces of each type that the regions after i take, then their squares
+    laterCapacity = [[0] * (len(pieceTypes) + 1)]
+    for region in reversed(regions[1:]):
+        later = [capacity + more for capacity, more in zip(laterCapacity[0], region.capacity + [len(region.shape)])]
+        laterCapacity.insert(0, later)
+
+    total = tuple(csp.maxNumberOfEachEnemies[pieceType] for pieceType in pieceTypes)
+    deadEnds = {}  # (region index, remaining numbers of pieces) -> True if the regions from there on cannot take them
+
+    # frame: [remaining numbers of pieces, iterator over the quotas of the region, its placement]
+    stack = [[total, iter(getRegionQuotas(regions[0], total, laterCapacity[0])), None]]
+    while len(stack) != 0:
+        index = len(stack) - 1
+        frame = stack[-1]
+        remaining, quotasLeft, _ = frame
+        quotas = next(quotasLeft, None)
+        if quotas == None:
+            deadEnds[(index, remaining)] = True
+            stack.pop()
+            continue
+
+        rest = tuple(quota - taken for quota, taken in zip(remaining, quotas))
+        if index + 1 < len(regions) and (index + 1, rest) in deadEnds:
+            continue
+        placement = regions[index].solve(quotas, csp)
+        if placement == None:
+            # the regions placed so far and the part of this one that was placed make up a partial assignment
+            partial = dict(regions[index].partial)
+            for earlier in stack[:-1]:
+                partial.update(earlier[2])
+            if len(partial) > len(csp.bestPartial):
+                csp.bestPartial = partial
+            return None
+        if placement == False:
+            continue
+        frame[2] = placement
+
+        if index + 1 == len(regions):
+            assignment = {}
+            for frame in stack:
+                assignment.update(frame[2])
+            return assignment
+        stack.append([rest, iter(getRegionQuotas(regions[index + 1], rest, laterCapacity[index + 1])), None])
     return False
 
+def getPortfolioConfigs(numOfWorkers: int) -> list:
+    '''(variable ordering, value ordering, tie break seed) of each worker: every combination
+    of the orderings first, then the default orderings with different random tie breaks'''
+    configs = []
+    for valueOrdering in ["least-constraining", "least-threatening"]:
+        for variableOrdering in ["fewest-positions", "fewest-per-piece"]:
+            configs.append((variableOrdering, valueOrdering, None))
+    seed = 0
+    while len(configs) < numOfWorkers:
+        seed += 1
+        configs.append(("fewest-positions", "least-constraining", seed))
+    return configs[:numOfWorkers]
+
+def portfolioWorker(workerId: int, instance, config: tuple, stopEvent, deadline, results) -> None:
+    csp = instance.copy() if isinstance(instance, State) else parser(instance)
+    csp.variableOrdering, csp.valueOrdering, seed = config
+    if seed != None:
+        csp.random = random.Random(seed)
+    csp.stopCondition = stopEvent.is_set
+    if deadline != None:
+        csp.stopCondition = lambda: stopEvent.is_set() or time() > deadline
+
+    startTime = time()
+    try:
+        result = backTrack(csp, Assignment(csp.maxNumberOfEachEnemies))
+    except Exception as error:
+        # report the error, since the portfolio waits for a result from every worker
+        results.put((workerId, None, csp.nodesExpanded, time() - startTime, {}, repr(error)))
+        return
+    partial = csp.bestPartial if result == None else None
+    results.put((workerId, result, csp.nodesExpanded, time() - startTime, partial, None))
+
+def portfolioSearch(instance, numOfWorkers: int = None):
+    '''Race differently configured searches of a test file or a parsed State in worker processes.
+
+    Returns the first solution found (False once a worker proved there is none) and a list
+    with the configuration, outcome, node count and running time of every worker. Once a
+    solution is found the other workers are asked to stop, and are terminated if they do not
+    report back in time. A worker that raises reports the error in its statistics, and one that
+    dies without reporting keeps the status "terminated".'''
+    solution, stats, _ = runPortfolio(instance, numOfWorkers)
+    return solution, stats
+
+def runPortfolio(instance, numOfWorkers: int = None, deadline: float = None):
+    '''Like portfolioSearch, with the workers giving up at the deadline (a time() value), if any.
+    Returns the solution (None if every worker gave up), the workers' statistics and the largest
+    partial assignment the workers that gave up reached.'''
+    if numOfWorkers == None:
+        numOfWorkers = NUM_OF_WORKERS
+    configs = getPortfolioConfigs(numOfWorkers)
+    stopEvent = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = []
+    for workerId, config in enumerate(configs):
+        worker = multiprocessing.Process(target=portfolioWorker, args=(workerId, instance, config, stopEvent, deadline, results))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+    stats = []
+    for workerId, (variableOrdering, valueOrdering, seed) in enumerate(configs):
+        stats.append({"worker": workerId, "variableOrdering": variableOrdering, "valueOrdering": valueOrdering,
+                      "seed": seed, "status": "terminated", "nodes": None, "seconds": None})
 
+    solution = None
+    solvedAt = None
+    bestPartial = {}
+    reported = set()
+    noneAlive = False
+    while len(reported) != len(workers):
+        try:
+            workerId, result, nodes, seconds, partial, error = results.get(timeout=PORTFOLIO_POLL_SECONDS)
+        except queue.Empty:
+            # once a solution is found, give the other workers a moment to notice the stop request
+            if solvedAt != None and time() > solvedAt + 1:
+                break
+            # a worker that died without reporting, killed by the system for instance, never will. Its
+            # last result may still be on its way, so poll once more before giving up on it.
+            if noneAlive:
+                break
+            noneAlive = not any([worker.is_alive() for i, worker in enumerate(workers) if i not in reported])
+            continue
+        reported.add(workerId)
+        stats[workerId]["nodes"] = nodes
+        stats[workerId]["seconds"] = seconds
+        if error != None:
+            stats[workerId]["status"] = "error"
+            stats[workerId]["error"] = error
+        elif result == None:
+            stats[workerId]["status"] = "stopped"
+            if len(partial) > len(bestPartial):
+                bestPartial = partial
+        elif result == False:
+            stats[workerId]["status"] = "no solution"
+            if solution == None:
+                # the search space is exhausted, so the other workers cannot find a solution either
+                solution = False
+                solvedAt = time()
+                stopEvent.set()
+        else:
+            stats[workerId]["status"] = "solved"
+            if solution == None:
+                solution = result
+                solvedAt = time()
+                stopEvent.set()
+
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
+    return solution, stats, bestPartial
 
-def search(testfile):
+def searchAll(testfile):
+    '''Yield every goal state, one at a time'''
     csp = parser(testfile)
+    for solution in exploreSolutions(csp):
+        goalState = {}
+        for pos in solution:
+            goalState[XYtoPos(pos)] = solution[pos]
+        yield goalState
+
+def countGoalStates(testfile) -> int:
+    return countSolutions(parser(testfile))
+
+def search(testfile, budget: float = None):
+    '''Assignment of (x, y) positions, or False if there is none. Given a budget in seconds, the
+    search gives up once it runs out and returns the largest consistent partial assignment found.'''
+    if budget != None:
+        assignment, _ = searchAnytime(parser(testfile), budget)
+        return assignment
+    if SEARCH_MODE == "portfolio":
+        solution, _ = portfolioSearch(testfile)
+        return solution
+    return searchState(parser(testfile))
+
+def searchState(csp: State, budget: float = None):
+    '''Solve a parsed instance, leaving it untouched. Returns the assignment of (x, y) positions,
+    False if there is none, or None if the state's stopCondition or the budget in seconds stopped the search.'''
+    solution, _, _ = searchCopy(csp, budget)
+    return solution
+
+def searchAnytime(csp: State, budget: float = None):
+    '''Solve a parsed instance within a budget in seconds. Returns the assignment and whether it is a
+    solution: the solution, False if there is none, or the largest consistent partial assignment
+    found if the search was stopped first.'''
+    solution, partial, _ = searchCopy(csp, budget)
+    if solution == None:
+        return partial, False
+    return solution, solution != False
+
+def searchWithStats(csp: State, budget: float = None):
+    '''Like searchState, also returning the statistics of the search as a dict if INSTRUMENT is set
+    (None otherwise), which are written to TRACE_PATH as well'''
+    solution, _, record = searchCopy(csp, budget)
+    return solution, record
+
+def searchCopy(csp: State, budget: float = None):
+    '''Search a copy of the state, stopping it once the budget in seconds runs out.
+    Returns the solution (see searchState), the largest partial assignment and the statistics.'''
+    deadline = None if budget == None else time() + budget
+    if SEARCH_MODE == "portfolio":
+        solution, _, partial = runPortfolio(csp, None, deadline)
+        return solution, partial, None
+    csp = csp.copy()
+    if deadline != None:
+        stopCondition = csp.stopCondition
+        csp.stopCondition = lambda: time() > deadline or (stopCondition != None and stopCondition())
+    startTime = time()
+    solution = runSearch(csp)
+    if csp.stats == None:
+        return solution, csp.bestPartial, None
+
+    record = {"solver": "CSP", "rows": csp.rows, "cols": csp.cols, "pieces": csp.maxNumberOfEachEnemies,
+              "engine": csp.engine, "mode": SEARCH_MODE,
+              "result": "stopped" if solution == None else "no solution" if solution == False else "solved",
+              "totalSeconds": time() - startTime, "nodesExpanded": csp.nodesExpanded}
+    record.update(csp.stats.toDict())
+    writeTrace(record)
+    return solution, csp.bestPartial, record
+
+def runSearch(csp: State):
+    if SEARCH_MODE == "min-conflicts":
+        solution = minConflicts(csp)
+        if solution != None:
+            return solution
+    if SPLIT_REGIONS:
+        return searchRegions(csp)
     return backTrack(csp, Assignment(csp.maxNumberOfEachEnemies))
+
+def toGoalState(rawResult):
+    '''Goal state with positions such as ('a', 0). False (no solution) and None (stopped) are passed on.'''
+    if rawResult == False or rawResult == None:
+        return rawResult
+    goalState = {}
+    for pos in rawResult:
+        goalState[XYtoPos(pos)] = rawResult[pos]
+    return goalState
+
+def solveInstance(instance):
+    '''Goal state of an instance given as a parsed State or as the text of a test file, or False
+    if it has none. Nothing outside the search is changed, so any number of instances can be
+    solved one after another in the same process.'''
+    if not isinstance(instance, State):
+        instance = parseText(instance)
+    return toGoalState(searchState(instance))
+
+def solveAnytime(instance, budget: float = None):
+    '''Like solveInstance within a budget in seconds, see searchAnytime. Returns the goal state
+    (or the partial one) and whether it is a goal state.'''
+    if not isinstance(instance, State):
+        instance = parseText(instance)
+    assignment, isGoal = searchAnytime(instance, budget)
+    return toGoalState(assignment), isGoal
+
+def solveBatch(instances):
+    '''Yield the goal state of each instance in turn, see solveInstance'''
+    for instance in instances:
+        yield solveInstance(instance)
     
 
 
@@ -420,9 +2079,7 @@ def run_CSP():
     testfile = sys.argv[1] #Do not remove. This is your input testfile.
     rawResult = search(testfile)
 
-    goalState = {}
-    for pos in rawResult:
-        goalState[XYtoPos(pos)] = rawResult[pos]
+    goalState = toGoalState(rawResult)
     
     return goalState #Format to be returned
 
@@ -0,0 +1,228 @@
+import json
+import sqlite3
+import hashlib
+from time import time
+
+import CSP
+import Local
+
+CACHE_PATH = "solutions.sqlite3"
+MAX_CACHE_ENTRIES = 100000
+
+# part of every key, so that answers cached by an older version of the solvers can be dropped by changing it
+CACHE_VERSION = 1
+
+def getTransforms(cols: int, rows: int) -> list:
+    '''The 8 symmetries of a board of the size, each as (new cols, new rows, map of (x, y)).
+    The ones that swap the axes map the board onto a board of rows x cols.'''
+    return [(cols, rows, lambda x, y: (x, y)),
+            (cols, rows, lambda x, y: (cols - 1 - x, y)),
+            (cols, rows, lambda x, y: (x, rows - 1 - y)),
+            (cols, rows, lambda x, y: (cols - 1 - x, rows - 1 - y)),
+            (rows, cols, lambda x, y: (y, x)),
+            (rows, cols, lambda x, y: (rows - 1 - y, cols - 1 - x)),
+            (rows, cols, lambda x, y: (rows - 1 - y, x)),
+            (rows, cols, lambda x, y: (y, cols - 1 - x))]
+
+def readCSPInstance(text: str) -> tuple:
+    '''("CSP", cols, rows, obstacles, numbers of each enemy type) of the text of a CSP test file'''
+    rows, cols, listOfObstacles, numOfEachEnemies = CSP.parseInstance(text)
+    counts = tuple([numOfEachEnemies[pieceType] for pieceType in CSP.Piece.enemyTypes])
+    return ("CSP", cols, rows, tuple(listOfObstacles), counts)
+
+def readLocalInstance(text: str) -> tuple:
+    '''("Local", cols, rows, obstacles, (K, enemies)) of the text of a Local test file,
+    each enemy being (x, y, type)'''
+    rows, cols, k, listOfObstacles, listOfEnemies = Local.parseText(text)
+    enemies = tuple([(x, y, enemyType) for enemyType, x, y in listOfEnemies])
+    return ("Local", cols, rows, tuple(listOfObstacles), (k, enemies))
+
+def transformInstance(instance: tuple, transform: tuple) -> tuple:
+    kind, _, _, obstacles, pieces = instance
+    newCols, newRows, mapPosition = transform
+    newObstacles = tuple(sorted([mapPosition(x, y) for x, y in obstacles]))
+    if kind == "Local":
+        k, enemies = pieces
+        newEnemies = []
+        for x, y, enemyType in enemies:
+            newEnemies.append(mapPosition(x, y) + (enemyType,))
+        pieces = (k, tuple(sorted(newEnemies)))
+    return (kind, newCols, newRows, newObstacles, pieces)
+
+def canonicalize(instance: tuple) -> tuple:
+    '''The smallest image of the instance under the symmetries of its board, and the transform that gives it.
+    Instances that are mirrored or rotated copies of each other have the same canonical form.'''
+    _, cols, rows, _, _ = instance
+    best = None
+    for transform in getTransforms(cols, rows):
+        image = transformInstance(instance, transform)
+        if best == None or image < best[0]:
+            best = (image, transform)
+    return best
+
+def hasThreats(cols: int, rows: int, obstacles, pieces: dict) -> bool:
+    '''Whether any of the pieces, a dict of (x, y) -> type, threatens another'''
+    attackTable = CSP.getAttackTable(cols, rows, obstacles)
+    for (x, y), pieceType in pieces.items():
+        for movement in CSP.Piece.movement[pieceType]:
+            for square in attackTable[movement][x][y]:
+                if square in pieces:
+                    return True
+                if square in obstacles:
+                    break
+    return False
+
+def isValidSolution(instance: tuple, solution: dict) -> bool:
+    '''Whether the solution, a dict of (x, y) -> type, is a goal state of the instance'''
+    kind, cols, rows, obstacles, pieces = instance
+    obstacles = set(obstacles)
+    for x, y in solution:
+        if not (0 <= x < cols and 0 <= y < rows) or (x, y) in obstacles:
+            return False
+    if kind == "CSP":
+        counts = tuple([list(solution.values()).count(pieceType) for pieceType in CSP.Piece.enemyTypes])
+        if counts != pieces:
+            return False
+    else:
+        k, enemies = pieces
+        enemyAt = {(x, y): enemyType for x, y, enemyType in enemies}
+        if len(solution) < k or any(enemyAt.get(position) != pieceType for position, pieceType in solution.items()):
+            return False
+    return not hasThreats(cols, rows, obstacles, solution)
+
+class SolutionCache:
+    '''Goal states of solved instances kept in an SQLite database, shared by every process that opens it.
+
+    Instances are looked up by a hash of their canonical form, so a mirrored or rotated copy of a
+    solved instance is answered by mapping the cached goal state back. The least recently used
+    entries are dropped once there are more than maxEntries.'''
+
+    def __init__(self, path: str = CACHE_PATH, maxEntries: int = MAX_CACHE_ENTRIES) -> None:
+        self.maxEntries = maxEntries
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS solutions "
+                                "(key TEXT PRIMARY KEY, instance TEXT, solution TEXT, lastUsed REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS solutionsByLastUsed ON solutions (lastUsed)")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def getKey(self, canonical: tuple) -> tuple:
+        instanceText = repr((CACHE_VERSION, canonical))
+        return hashlib.sha256(instanceText.encode()).hexdigest(), instanceText
+
+    def get(self, instance: tuple):
+        '''Cached goal state of the instance as a dict of (x, y) -> type, False if it is known to have
+        none, or None if there is no valid cached answer'''
+        canonical, transform = canonicalize(instance)
+        key, instanceText = self.getKey(canonical)
+        row = self.connection.execute("SELECT instance, solution FROM solutions WHERE key = ?", (key,)).fetchone()
+        if row == None or row[0] != instanceText:
+            self.misses += 1
+            return None
+
+        cached = json.loads(row[1])
+        if cached == None:
+            solution = False
+        else:
+            # map the canonical positions back to the instance's
+            _, cols, rows, _, _ = instance
+            inverse = {}
+            mapPosition = transform[2]
+            for x in range(cols):
+                for y in range(rows):
+                    inverse[mapPosition(x, y)] = (x, y)
+            solution = {}
+            for x, y, pieceType in cached:
+                solution[inverse.get((x, y), (-1, -1))] = pieceType
+            if not isValidSolution(instance, solution):
+                self.connection.execute("DELETE FROM solutions WHERE key = ?", (key,))
+                self.connection.commit()
+                self.misses += 1
+                return None
+
+        self.connection.execute("UPDATE solutions SET lastUsed = ? WHERE key = ?", (time(), key))
+        self.connection.commit()
+        self.hits += 1
+        return solution
+
+    def put(self, instance: tuple, solution) -> None:
+        '''Cache the goal state of the instance, a dict of (x, y) -> type, or False if it has none'''
+        canonical, transform = canonicalize(instance)
+        key, instanceText = self.getKey(canonical)
+        if solution == False:
+            cached = None
+        else:
+            mapPosition = transform[2]
+            cached = sorted([mapPosition(x, y) + (pieceType,) for (x, y), pieceType in solution.items()])
+        self.connection.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)",
+                                (key, instanceText, json.dumps(cached), time()))
+        numOfEntries = self.connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        if numOfEntries > self.maxEntries:
+            self.connection.execute("DELETE FROM solutions WHERE key IN "
+                                    "(SELECT key FROM solutions ORDER BY lastUsed LIMIT ?)", (numOfEntries - self.maxEntries,))
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+defaultCache = None
+
+def getDefaultCache() -> SolutionCache:
+    '''Cache at CACHE_PATH, opened on first use by each process'''
+    global defaultCache
+    if defaultCache == None:
+        defaultCache = SolutionCache()
+    return defaultCache
+
+def toGoalState(solution):
+    if solution == False:
+        return False
+    return {CSP.XYtoPos(position): pieceType for position, pieceType in solution.items()}
+
+def solveAnytime(text: str, isLocal: bool, cache: SolutionCache = None, budget: float = None):
+    '''Goal state of the instance given as the text of a test file and whether it is one, answered from
+    the cache when possible. Given a budget in seconds, the solvers return their best effort once it runs
+    out, see CSP.searchAnytime and Local.searchAnytime. Only goal states and CSP instances proven to have
+    none are cached.'''
+    if cache == None:
+        cache = getDefaultCache()
+    instance = readLocalInstance(text) if isLocal else readCSPInstance(text)
+    solution = cache.get(instance)
+    if solution != None:
+        return toGoalState(solution), solution != False
+
+    if isLocal:
+        goalState, isGoal = Local.solveAnytime(text, budget)
+        solution = {(Local.letterToX(pos[0]), pos[1]): pieceType for pos, pieceType in goalState.items()}
+    else:
+        solution, isGoal = CSP.searchAnytime(CSP.parseText(text), budget)
+    if isGoal or solution == False:
+        cache.put(instance, solution)
+    return toGoalState(solution), isGoal
+
+def solveCSP(text: str, cache: SolutionCache = None, budget: float = None):
+    '''Goal state of a CSP instance given as the text of a test file, like CSP.solveInstance, answered
+    from the cache when possible'''
+    goalState, _ = solveAnytime(text, False, cache, budget)
+    return goalState
+
+def solveLocal(text: str, cache: SolutionCache = None, budget: float = None):
+    '''Goal state of a Local instance given as the text of a test file, like Local.solveInstance, answered
+    from the cache when possible'''
+    goalState, _ = solveAnytime(text, True, cache, budget)
+    return goalState
+
+def searchCSP(testfile, cache: SolutionCache = None, budget: float = None):
+    '''Goal state of the CSP test file, as returned by CSP.run_CSP'''
+    f = open(testfile, "r")
+    text = f.read()
+    f.close()
+    return solveCSP(text, cache, budget)
+
+def searchLocal(testfile, cache: SolutionCache = None, budget: float = None):
+    '''Goal state of the Local test file, as returned by Local.run_local'''
+    f = open(testfile, "r")
+    text = f.read()
+    f.close()
+    return solveLocal(text, cache, budget)
@@ -2,13 +2,15 @@ import sys
 import random
 import heapq
 
+import CSP
+
 class Piece:
 
     movement = {"King": [(1, 1, 1), (1, 0, 1), (1, -1, 1), (0, -1, 1), (-1, -1, 1), (-1, 0, 1), (-1, 1, 1), (0, 1, 1)],
                 "Rook": [(1, 0, 0), (0, -1, 0), (-1, 0, 0), (0, 1, 0)],
                 "Bishop": [(1, 1, 0), (1, -1, 0), (-1, -1, 0), (-1, 1, 0)],
                 "Queen": [(1, 0, 0), (0, -1, 0), (-1, 0, 0), (0, 1, 0), (1, 1, 0), (1, -1, 0), (-1, -1, 0), (-1, 1, 0)],
-                "Knight": [],
+                "Knight": [(2, 1, 1), (2, -1, 1), (1, 2, 1), (1, -2, 1), (-2, 1, 1), (-2, -1, 1), (-1, 2, 1), (-1, -2, 1)],
                 "Obstacle": [],
                 "Empty": [],
                 }
@@ -26,11 +28,13 @@ class Piece:
 class Board:
 
 
-    def __init__(self, x: int, y: int) -> None:
+    def __init__(self, x: int, y: int, attackTable = None) -> None:
         self.enemyPos = {}  # (x, y) -> Enemy type
         self.obstaclePos = []
         self.board_size_x = x
         self.board_size_y = y
+        # must match the obstacles of the board, looked up after the obstacles are added if not given
+        self.attackTable = attackTable
 
         self.blocked = []
         for i in range(x):
@@ -48,6 +52,11 @@ class Board:
         self.obstaclePos.append((x, y))
         self.blocked[x][y] = True
 
+    def getAttackTable(self) -> dict:
+        if self.attackTable == None:
+            self.attackTable = CSP.getAttackTable(self.board_size_x, self.board_size_y, self.obstaclePos)
+        return self.attackTable
+
     def isWithinBoard(self, x, y) -> bool:
         if (0 > x or x >= self.board_size_x) or (0 > y or y >= self.board_size_y):
             return False
@@ -58,7 +67,7 @@ class Board:
         return self.numOfEnemiesThreatening[x][y] > 0
 
     def isBlocked(self, x, y) -> bool:
-        return (x, y) in self.obstaclePos or (x, y) in self.enemyPos.keys()
+        return self.blocked[x][y]
 
     def setThreatened(self, x, y) -> None:
         if (x, y) in self.enemyPos:
@@ -73,18 +82,10 @@ class Board:
 
         for x, y in self.enemyPos:
             piece: Piece = self.enemyPos[(x, y)]
-            if piece.type == "Knight":
-                for twoSteps in [-2, 2]:
-                    for oneStep in [-1, 1]:
-                        if self.isWithinBoard(x + twoSteps, y+oneStep):
-                            self.setThreatened(x+twoSteps, y+oneStep)
-                        if self.isWithinBoard(x + oneStep, y+twoSteps):
-                            self.setThreatened(x+oneStep, y+twoSteps)
-            else:
-                transModel = pieceMovementModel(
-                    self, x, y, piece.possibleMovement())
-                for possibleX, possibleY in transModel.getAllPossibleNewPos():
-                    self.setThreatened(possibleX, possibleY)
+            transModel = pieceMovementModel(
+                self, x, y, piece.possibleMovement())
+            for possibleX, possibleY in transModel.getAllPossibleNewPos():
+                self.setThreatened(possibleX, possibleY)
         
         # calculate to find out the ranking of threatened
         self.numOfEnemiesThreatening_ranked = []
@@ -128,6 +129,7 @@ class pieceMovementModel():
         self.y = y
         self.board = board
         self.movements = piece_movements
+        self.attackTable = board.getAttackTable()
 
     def moveToDirection(self, x_change: int, y_change: int):
         new_x = self.x + x_change
@@ -136,17 +138,12 @@ class pieceMovementModel():
 
     def getAllPossibleMovementToDirection(self, x_change: int, y_change: int, max_steps=0):
         '''Get all the positions that the piece can move to, including position that are being threatened by other pieces'''
-        if max_steps == 0:
-            max_steps = max(self.board.board_size_x, self.board.board_size_y)
+        # the ray already stops at the first obstacle, only enemy pieces can cut it shorter
         steps = []
-        for i in range(max_steps):
-            new_pos = self.moveToDirection((i+1) * x_change, (i+1) * y_change)
-            if not self.board.isWithinBoard(new_pos[0], new_pos[1]):
-                break
-            if self.board.isBlocked(new_pos[0], new_pos[1]):
-                steps.append(new_pos)
-                break
+        for new_pos in self.attackTable[(x_change, y_change, max_steps)][self.x][self.y]:
             steps.append(new_pos)
+            if self.board.blocked[new_pos[0]][new_pos[1]]:
+                break
         return steps
 
     def getAllPossibleNewPos(self):
@@ -159,12 +156,9 @@ class pieceMovementModel():
 
     def getAllAllowedMovementToDirection(self, x_change: int, y_change: int, max_steps=0):
         '''Get all the positions that the piece can move to without being threatened'''
-        if max_steps == 0:
-            max_steps = max(self.board.board_size_x, self.board.board_size_y)
         steps = []
-        for i in range(max_steps):
-            new_pos = self.moveToDirection((i+1) * x_change, (i+1) * y_change)
-            if not self.board.isWithinBoard(new_pos[0], new_pos[1]) or self.board.isBlocked(new_pos[0], new_pos[1]):
+        for new_pos in self.attackTable[(x_change, y_change, max_steps)][self.x][self.y]:
+            if self.board.blocked[new_pos[0]][new_pos[1]]:
                 break
             if self.board.isThreatened(new_pos[0], new_pos[1]):
                 continue
@@ -185,8 +179,8 @@ class State:
     def __init__(self) -> None:
         self.board = []
 
-    def initBoard(self, x: int, y: int) -> Board:
-        self.board = Board(x, y)
+    def initBoard(self, x: int, y: int, attackTable = None) -> Board:
+        self.board = Board(x, y, attackTable)
 
     def setBoard(self, board: Board) -> None:
         self.board = board
@@ -0,0 +1,126 @@
+import sys
+import random
+import argparse
+
+import CSP
+import Server
+
+PIECE_TYPES = ["King", "Queen", "Bishop", "Rook", "Knight"]
+
+def isSafe(attackTable: dict, pieces: dict, pieceType: str, x: int, y: int) -> bool:
+    '''Whether a piece of the type at (x, y) and the pieces, a dict of (x, y) -> type, leave each other alone'''
+    for movement in CSP.Piece.movement[pieceType]:
+        for square in attackTable[movement][x][y]:
+            if square in pieces:
+                return False
+    for (otherX, otherY), otherType in pieces.items():
+        for movement in CSP.Piece.movement[otherType]:
+            for square in attackTable[movement][otherX][otherY]:
+                if square == (x, y):
+                    return False
+                if square in pieces:
+                    break
+    return True
+
+def randomBoard(rng: random.Random, cols: int, rows: int, obstacleDensity: float) -> list:
+    squares = [(x, y) for x in range(cols) for y in range(rows)]
+    return sorted(rng.sample(squares, int(obstacleDensity * len(squares))))
+
+def plantPieces(rng: random.Random, cols: int, rows: int, listOfObstacles, numOfPieces: int, mix: dict) -> dict:
+    '''Place up to numOfPieces pieces that do not threaten each other on random free squares, their
+    types drawn with the weights of the mix. Placing a piece only blocks rays, so the pieces placed
+    so far stay safe. Returns the pieces as a dict of (x, y) -> type.'''
+    attackTable = CSP.getAttackTable(cols, rows, listOfObstacles)
+    obstacles = set(listOfObstacles)
+    free = [(x, y) for x in range(cols) for y in range(rows) if (x, y) not in obstacles]
+    rng.shuffle(free)
+    types = [pieceType for pieceType in PIECE_TYPES if mix.get(pieceType, 0) > 0]
+    weights = [mix[pieceType] for pieceType in types]
+
+    pieces = {}
+    while len(pieces) < numOfPieces and len(types) != 0:
+        pieceType = rng.choices(types, weights)[0]
+        for i, (x, y) in enumerate(free):
+            if isSafe(attackTable, pieces, pieceType, x, y):
+                pieces[(x, y)] = pieceType
+                free.pop(i)
+                break
+        else:
+            # no square is left for the type, so draw from the others
+            weights[types.index(pieceType)] = 0
+            if sum(weights) == 0:
+                break
+    return pieces
+
+def toPos(position: tuple) -> str:
+    x, y = CSP.XYtoPos(position)
+    return x + str(y)
+
+def generateCSP(cols: int, rows: int, obstacleDensity: float = 0.0, numOfPieces: int = None, mix: dict = None, seed = None) -> str:
+    '''Text of a CSP test file with a planted solution. The numbers of pieces are the ones that were
+    planted, which may be fewer than numOfPieces (by default one per row) on crowded boards.'''
+    rng = random.Random(seed)
+    if numOfPieces == None:
+        numOfPieces = rows
+    if mix == None:
+        mix = {pieceType: 1 for pieceType in PIECE_TYPES}
+    listOfObstacles = randomBoard(rng, cols, rows, obstacleDensity)
+    pieces = plantPieces(rng, cols, rows, listOfObstacles, numOfPieces, mix)
+    counts = [list(pieces.values()).count(pieceType) for pieceType in PIECE_TYPES]
+    return Server.toText({"rows": rows, "cols": cols, "obstacles": [toPos(obstacle) for obstacle in listOfObstacles],
+                          "pieces": counts})
+
+def generateLocal(cols: int, rows: int, obstacleDensity: float = 0.0, numOfPieces: int = None, kRatio: float = 0.5,
+                  mix: dict = None, seed = None) -> str:
+    '''Text of a Local test file with numOfPieces pieces (by default a third of the free squares)
+    of which K = kRatio * numOfPieces are planted so that they do not threaten each other'''
+    rng = random.Random(seed)
+    if mix == None:
+        mix = {pieceType: 1 for pieceType in PIECE_TYPES}
+    listOfObstacles = randomBoard(rng, cols, rows, obstacleDensity)
+    numOfFree = cols * rows - len(listOfObstacles)
+    if numOfPieces == None:
+        numOfPieces = numOfFree // 3
+    numOfPieces = min(numOfPieces, numOfFree)
+
+    pieces = plantPieces(rng, cols, rows, listOfObstacles, max(1, round(kRatio * numOfPieces)), mix)
+    k = len(pieces)
+    obstacles = set(listOfObstacles)
+    free = [(x, y) for x in range(cols) for y in range(rows) if (x, y) not in obstacles and (x, y) not in pieces]
+    types = [pieceType for pieceType in PIECE_TYPES if mix.get(pieceType, 0) > 0]
+    weights = [mix[pieceType] for pieceType in types]
+    for position in rng.sample(free, max(0, numOfPieces - k)):
+        pieces[position] = rng.choices(types, weights)[0]
+
+    positions = [[pieces[position], toPos(position)] for position in sorted(pieces)]
+    return Server.toText({"rows": rows, "cols": cols, "obstacles": [toPos(obstacle) for obstacle in listOfObstacles],
+                          "k": k, "positions": positions})
+
+def parseMix(text: str) -> dict:
+    '''Weights of the piece types from text such as "Queen=2,Knight=1"'''
+    mix = {}
+    for item in text.split(","):
+        pieceType, weight = item.split("=")
+        mix[pieceType.strip()] = float(weight)
+    return mix
+
+def main() -> None:
+    argumentParser = argparse.ArgumentParser(description="Print a satisfiable CSP or Local test file with a planted solution.")
+    argumentParser.add_argument("solver", choices=["CSP", "Local"])
+    argumentParser.add_argument("--cols", type=int, default=8)
+    argumentParser.add_argument("--rows", type=int, default=8)
+    argumentParser.add_argument("--obstacles", type=float, default=0.0, help="fraction of the squares that are obstacles")
+    argumentParser.add_argument("--pieces", type=int, help="number of pieces, planted for CSP and on the board for Local")
+    argumentParser.add_argument("--mix", type=parseMix, help="weights of the piece types, such as Queen=2,Knight=1")
+    argumentParser.add_argument("--k-ratio", type=float, default=0.5, help="K as a fraction of the pieces on the board (Local)")
+    argumentParser.add_argument("--seed", type=int)
+    arguments = argumentParser.parse_args()
+    if arguments.solver == "CSP":
+        text = generateCSP(arguments.cols, arguments.rows, arguments.obstacles, arguments.pieces, arguments.mix, arguments.seed)
+    else:
+        text = generateLocal(arguments.cols, arguments.rows, arguments.obstacles, arguments.pieces, arguments.k_ratio,
+                             arguments.mix, arguments.seed)
+    sys.stdout.write(text)
+
+if __name__ == "__main__":
+    main()
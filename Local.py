@@ -1,10 +1,57 @@
 import sys
+import json
 import random
 import heapq
+from math import exp, log
+from time import time
  
+import CSP
+ 
+# "hill-climbing" moves one selection of K enemies to its best neighbour, restarting from a random one
+# when the restart policy says it is stuck; "beam" keeps the BEAMS best selections and expands all their
+# neighbours, see beamSearch; "annealing" and "tabu" also take worse moves to get out of local minima,
+# see simulatedAnnealing and tabuSearch. runSearch and searchWithStats can pick another mode per run.
+SEARCH_MODES = ["hill-climbing", "beam", "annealing", "tabu"]
+SEARCH_MODE = "hill-climbing"
 BEAMS = 5
+ 
+# a search starts again from a random selection once it has gone a number of steps without a lower cost
+# than its run had: RESTART_AFTER_STEPS each run for the "fixed" policy, RESTART_AFTER_STEPS times the
+# Luby sequence 1, 1, 2, 1, 1, 2, 4, ... for "luby", and RESTART_AFTER_STEPS growing by RESTART_GROWTH
+# each run for "geometric", up to MAX_RESTART_STEPS so that the restarts run out in a bounded number of
+# steps. Hill climbing moves sideways, to a neighbour with as many threats, when none has fewer, so those
+# moves are the steps without a lower cost that end its runs. After MAX_RESTARTS restarts (None for no
+# limit) the search gives up and returns the configuration with the fewest threatened pieces seen.
+RESTART_POLICIES = ["fixed", "luby", "geometric"]
+RESTART_POLICY = "fixed"
 RESTART_AFTER_STEPS = 20
-MAX_RESTARTS = 100
+RESTART_GROWTH = 1.5
+MAX_RESTART_STEPS = 500
+MAX_RESTARTS = 500
+# every mode also gives up once it has evaluated MAX_NEIGHBOURS neighbours over all its runs (None for no
+# limit), a few seconds of search, so that an instance with no goal state ends in seconds whatever the
+# mode and restart policy. Solvable instances of up to 16x16 evaluated at most about half as many in every
+# mode, larger ones may need more.
+MAX_NEIGHBOURS = 100000
+ 
+# simulated annealing cools from the start to the end temperature over ANNEALING_CYCLE_STEPS random
+# neighbours, "geometric"ally, "linear"ly or "logarithmic"ally, then heats up again from where it is.
+# A neighbour that adds d threats is taken with probability exp(-d / temperature).
+ANNEALING_SCHEDULE = "geometric"
+ANNEALING_START_TEMPERATURE = 2.0
+ANNEALING_END_TEMPERATURE = 0.05
+ANNEALING_CYCLE_STEPS = 20000
+# neighbours drawn by annealing that count as one step of the restart policy
+ANNEALING_RESTART_UNIT = 500
+ 
+# tabu search does not put back an enemy it took off, or take off one it put on, for this many steps,
+# unless the move gives a lower cost than any seen so far
+TABU_TENURE = 7
+ 
+# count restarts, steps and neighbours evaluated and keep the cost after every step. Each search
+# appends its statistics as a JSON line to TRACE_PATH, if set.
+INSTRUMENT = False
+TRACE_PATH = None
  
 class Piece:
  
@@ -12,7 +59,7 @@ class Piece:
                 "Rook": [(1, 0, 0), (0, -1, 0), (-1, 0, 0), (0, 1, 0)],
                 "Bishop": [(1, 1, 0), (1, -1, 0), (-1, -1, 0), (-1, 1, 0)],
                 "Queen": [(1, 0, 0), (0, -1, 0), (-1, 0, 0), (0, 1, 0), (1, 1, 0), (1, -1, 0), (-1, -1, 0), (-1, 1, 0)],
-                "Knight": [],
+                "Knight": [(2, 1, 1), (2, -1, 1), (1, 2, 1), (1, -2, 1), (-2, 1, 1), (-2, -1, 1), (-1, 2, 1), (-1, -2, 1)],
                 "Obstacle": [],
                 "Empty": [],
                 }
@@ -27,173 +74,171 @@ class Piece:
         return self.movement[self.type]
  
  
-class Board:
- 
- 
-    def __init__(self, x: int, y: int) -> None:
-        self.enemyPos = {}  # (x, y) -> Enemy type
-        self.obstaclePos = []
-        self.board_size_x = x
-        self.board_size_y = y
- 
-        self.blocked = []
-        for i in range(x):
-            self.blocked.append([False, ] * y)
- 
-    def addEnemyPiece(self, pieceType: str, x: int, y: int) -> None:
-        self.enemyPos[(x, y)] = Piece(pieceType)
-        self.blocked[x][y] = True
- 
-    def removeEnemyPiece(self, x: int, y: int) -> None:
-        self.enemyPos.pop((x, y))
-        self.blocked[x][y] = False
- 
-    def addObstaclePiece(self, x: int, y: int) -> None:
-        self.obstaclePos.append((x, y))
-        self.blocked[x][y] = True
- 
-    def isWithinBoard(self, x, y) -> bool:
-        if (0 > x or x >= self.board_size_x) or (0 > y or y >= self.board_size_y):
-            return False
-        return True
- 
-    def isThreatened(self, x, y) -> bool:
-        # Must update threatened first!!!
-        return self.numOfEnemiesThreatening[x][y] > 0
- 
-    def isBlocked(self, x, y) -> bool:
-        return (x, y) in self.obstaclePos or (x, y) in self.enemyPos.keys()
- 
-    def setThreatened(self, x, y) -> None:
-        if (x, y) in self.enemyPos:
-            self.numOfEnemiesThreatening[x][y] += 1
- 
-    def updateThreatened(self):
- 
-        # Reset number of pieces threatening a piece
-        self.numOfEnemiesThreatening = []
-        for i in range(self.board_size_x):
-            self.numOfEnemiesThreatening.append([0, ] * self.board_size_y)
- 
-        for x, y in self.enemyPos:
-            piece: Piece = self.enemyPos[(x, y)]
-            if piece.type == "Knight":
-                for twoSteps in [-2, 2]:
-                    for oneStep in [-1, 1]:
-                        if self.isWithinBoard(x + twoSteps, y+oneStep):
-                            self.setThreatened(x+twoSteps, y+oneStep)
-                        if self.isWithinBoard(x + oneStep, y+twoSteps):
-                            self.setThreatened(x+oneStep, y+twoSteps)
-            else:
-                transModel = pieceMovementModel(
-                    self, x, y, piece.possibleMovement())
-                for possibleX, possibleY in transModel.getAllPossibleNewPos():
-                    self.setThreatened(possibleX, possibleY)
-        
-        # calculate to find out the ranking of threatened
-        self.numOfEnemiesThreatening_ranked = []
-        for x, y in self.enemyPos:
-            if self.numOfEnemiesThreatening[x][y] == 0:
+# directions of the lines along which pieces threaten each other
+LINE_DIRECTIONS = [(1, 0), (0, -1), (-1, 0), (0, 1), (1, 1), (1, -1), (-1, -1), (-1, 1)]
+ 
+class PieceIndex:
+    '''What the enemies of an instance can reach, built once per instance since neither the enemies
+    nor the obstacles change during the search, only which of the enemies are on the board.
+ 
+    Enemies are numbered in the order of listOfEnemies. lines[i][direction] holds (j, distance) for
+    the other enemies along the ray from enemy i in the line direction, nearest first, up to the edge
+    of the board or the first obstacle. knightTargets[i] holds the enemies a knight's move away. Only
+    enemies can stand on the squares in between, so the first of them on the board is where a ray
+    from enemy i stops.'''
+ 
+    def __init__(self, cols: int, rows: int, listOfObstacles, listOfEnemies, attackTable = None) -> None:
+        if attackTable == None:
+            attackTable = CSP.getAttackTable(cols, rows, listOfObstacles)
+        self.enemies = listOfEnemies
+        enemyAt = {}
+        for i, (_, x, y) in enumerate(listOfEnemies):
+            enemyAt[(x, y)] = i
+ 
+        self.lines = []
+        self.knightTargets = []
+        for _, x, y in listOfEnemies:
+            lines = {}
+            for xChange, yChange in LINE_DIRECTIONS:
+                line = []
+                for distance, position in enumerate(attackTable[(xChange, yChange, 0)][x][y], 1):
+                    if position in enemyAt:
+                        line.append((enemyAt[position], distance))
+                lines[(xChange, yChange)] = tuple(line)
+            self.lines.append(lines)
+            targets = []
+            for movement in Piece.movement["Knight"]:
+                for position in attackTable[movement][x][y]:
+                    if position in enemyAt:
+                        targets.append(enemyAt[position])
+            self.knightTargets.append(tuple(targets))
+ 
+        # piece type -> direction -> how far the piece threatens along it (0 if it does not)
+        self.reach = {}
+        for pieceType in Piece.movement:
+            self.reach[pieceType] = {}
+            for direction in LINE_DIRECTIONS:
+                self.reach[pieceType][direction] = 0
+            for xChange, yChange, maxSteps in Piece.movement[pieceType]:
+                if (xChange, yChange) in self.reach[pieceType]:
+                    self.reach[pieceType][(xChange, yChange)] = maxSteps if maxSteps != 0 else max(cols, rows)
+ 
+ 
+class ThreatBoard:
+    '''Enemies on the board for the hill climbing search, by their numbers in a PieceIndex, keeping the
+    number of threats up to date.
+ 
+    For every line direction and enemy it keeps the nearest enemy on the board in that direction, so
+    the threats an enemy makes and receives are found without walking rays. Adding or removing an
+    enemy only updates the enemies on the lines through it, and getAddedCost gives the change in the
+    number of threats that adding an enemy would make without changing anything.'''
+ 
+    def __init__(self, index: PieceIndex) -> None:
+        self.index = index
+        self.types = [enemyType for enemyType, _, _ in index.enemies]
+        self.pieces = {}  # numbers of the enemies on the board, in the order they were added
+        self.cost = 0  # sum over the enemies on the board of the number of them threatening it
+ 
+        # direction -> (number of the nearest enemy on the board in that direction, distance to it)
+        # or None, for every enemy
+        self.nearest = {}
+        for direction in LINE_DIRECTIONS:
+            self.nearest[direction] = [None] * len(index.enemies)
+        self.numOfKnightsAttacking = [0] * len(index.enemies)
+ 
+    def countThreats(self, i: int) -> tuple:
+        '''(number of enemies on the board that enemy i threatens, number of them threatening it)'''
+        reach = self.index.reach
+        pieceType = self.types[i]
+        made = 0
+        received = self.numOfKnightsAttacking[i]
+        for xChange, yChange in LINE_DIRECTIONS:
+            nearest = self.nearest[(xChange, yChange)][i]
+            if nearest == None:
                 continue
-            heapq.heappush(self.numOfEnemiesThreatening_ranked, (x, y))
-    
-    def getTopThreatened(self, n: int):
-        return heapq.nlargest(n, self.numOfEnemiesThreatening_ranked)
- 
-    def getMostThreatenedPos(self):
-        highestThreatened = 0
-        resultX, resultY = list(self.enemyPos.keys())[0]
- 
-        for x, y in self.enemyPos:
-            # print(x, y, self.numOfEnemiesThreatening[x][y])
-            if self.numOfEnemiesThreatening[x][y] > highestThreatened:
-                highestThreatened = self.numOfEnemiesThreatening[x][y]
-                resultX, resultY = x, y
- 
-        return (resultX, resultY, highestThreatened)
- 
-    def setGoal(self, K: int) -> None:
-        self.K = K
- 
-    def goalCheck(self) -> bool:
-        return len(self.enemyPos) >= self.K and self.sumOfThreatened() == 0
-    
-    def sumOfThreatened(self):
-        sum = 0
-        for x, y in self.enemyPos:
-            sum += self.numOfEnemiesThreatening[x][y]
-        return sum
- 
- 
-class pieceMovementModel():
- 
-    def __init__(self, board: Board, x: int, y: int, piece_movements):
-        self.x = x
-        self.y = y
-        self.board = board
-        self.movements = piece_movements
- 
-    def moveToDirection(self, x_change: int, y_change: int):
-        new_x = self.x + x_change
-        new_y = self.y + y_change
-        return (new_x, new_y)
- 
-    def getAllPossibleMovementToDirection(self, x_change: int, y_change: int, max_steps=0):
-        '''Get all the positions that the piece can move to, including position that are being threatened by other pieces'''
-        if max_steps == 0:
-            max_steps = max(self.board.board_size_x, self.board.board_size_y)
-        steps = []
-        for i in range(max_steps):
-            new_pos = self.moveToDirection((i+1) * x_change, (i+1) * y_change)
-            if not self.board.isWithinBoard(new_pos[0], new_pos[1]):
-                break
-            if self.board.isBlocked(new_pos[0], new_pos[1]):
-                steps.append(new_pos)
-                break
-            steps.append(new_pos)
-        return steps
- 
-    def getAllPossibleNewPos(self):
-        steps = []
-        for movement in self.movements:
-            xChange, yChange, maxSteps = movement
-            steps.extend(self.getAllPossibleMovementToDirection(
-                xChange, yChange, maxSteps))
-        return steps
- 
-    def getAllAllowedMovementToDirection(self, x_change: int, y_change: int, max_steps=0):
-        '''Get all the positions that the piece can move to without being threatened'''
-        if max_steps == 0:
-            max_steps = max(self.board.board_size_x, self.board.board_size_y)
-        steps = []
-        for i in range(max_steps):
-            new_pos = self.moveToDirection((i+1) * x_change, (i+1) * y_change)
-            if not self.board.isWithinBoard(new_pos[0], new_pos[1]) or self.board.isBlocked(new_pos[0], new_pos[1]):
-                break
-            if self.board.isThreatened(new_pos[0], new_pos[1]):
+            other, distance = nearest
+            if reach[pieceType][(xChange, yChange)] >= distance:
+                made += 1
+            if reach[self.types[other]][(-xChange, -yChange)] >= distance:
+                received += 1
+        if pieceType == "Knight":
+            for other in self.index.knightTargets[i]:
+                if other in self.pieces:
+                    made += 1
+        return made, received
+ 
+    def getAddedCost(self, i: int) -> int:
+        '''Change in the number of threats from adding enemy i to the board.
+        Called for an enemy on the board, it is what removing the enemy takes away.'''
+        made, received = self.countThreats(i)
+        cost = made + received
+        # the enemy blocks the threats between the enemies on either side of it
+        reach = self.index.reach
+        for xChange, yChange in LINE_DIRECTIONS:
+            attacker = self.nearest[(xChange, yChange)][i]
+            target = self.nearest[(-xChange, -yChange)][i]
+            if attacker == None or target == None:
                 continue
-            steps.append(new_pos)
-        return steps
- 
-    def getAllAllowedNewPos(self):
-        steps = []
-        for movement in self.movements:
-            xChange, yChange, maxSteps = movement
-            steps.extend(self.getAllAllowedMovementToDirection(
-                xChange, yChange, maxSteps))
-        return steps
- 
- 
-class State:
- 
-    def __init__(self) -> None:
-        self.board = []
- 
-    def initBoard(self, x: int, y: int) -> Board:
-        self.board = Board(x, y)
+            if reach[self.types[attacker[0]]][(-xChange, -yChange)] >= attacker[1] + target[1]:
+                cost -= 1
+        return cost
+ 
+    def addPiece(self, i: int) -> None:
+        self.cost += self.getAddedCost(i)
+        # enemy i becomes the nearest for the enemies behind it, up to the next one on the board
+        for xChange, yChange in LINE_DIRECTIONS:
+            nearest = self.nearest[(xChange, yChange)]
+            for other, distance in self.index.lines[i][(-xChange, -yChange)]:
+                nearest[other] = (i, distance)
+                if other in self.pieces:
+                    break
+        if self.types[i] == "Knight":
+            for other in self.index.knightTargets[i]:
+                self.numOfKnightsAttacking[other] += 1
+        self.pieces[i] = True
+ 
+    def removePiece(self, i: int) -> None:
+        self.cost -= self.getAddedCost(i)
+        del self.pieces[i]
+        # the enemies behind enemy i now see the enemy that it saw
+        for xChange, yChange in LINE_DIRECTIONS:
+            nearest = self.nearest[(xChange, yChange)]
+            replacement = nearest[i]
+            for other, distance in self.index.lines[i][(-xChange, -yChange)]:
+                nearest[other] = None if replacement == None else (replacement[0], replacement[1] + distance)
+                if other in self.pieces:
+                    break
+        if self.types[i] == "Knight":
+            for other in self.index.knightTargets[i]:
+                self.numOfKnightsAttacking[other] -= 1
+ 
+    def copy(self):
+        newCopy = ThreatBoard(self.index)
+        newCopy.pieces = dict(self.pieces)
+        newCopy.cost = self.cost
+        for direction in LINE_DIRECTIONS:
+            newCopy.nearest[direction] = list(self.nearest[direction])
+        newCopy.numOfKnightsAttacking = list(self.numOfKnightsAttacking)
+        return newCopy
+ 
+    def getMostThreatened(self) -> tuple:
+        '''(number of the first of the most threatened enemies on the board, number of enemies threatening it)'''
+        highestThreatened = 0
+        result = next(iter(self.pieces))
+        for i in self.pieces:
+            _, received = self.countThreats(i)
+            if received > highestThreatened:
+                highestThreatened = received
+                result = i
+        return (result, highestThreatened)
+ 
+    def getGoalState(self) -> dict:
+        result = {}
+        for i in self.pieces:
+            enemyType, x, y = self.index.enemies[i]
+            result[XYtoPos((x, y))] = enemyType
+        return result
  
-    def setBoard(self, board: Board) -> None:
-        self.board = board
  
 def letterToX(character) -> int:
     return ord(character) - ord('a')
@@ -209,15 +254,19 @@ def XYtoPos(xy: tuple) -> tuple:
  
 def parser(testfile):
     f = open(testfile, "r")
+    text = f.read()
+    f.close()
+    return parseText(text)
+ 
+def parseText(text: str):
+    '''(rows, cols, K, obstacles, enemies) of the instance described by the text of a test file'''
+    lines = iter(text.splitlines())
  
     def input():
-        line = f.readline().strip("\n")
-        return line
+        return next(lines, "")
  
     rows = int(input().split(":")[1])
     cols = int(input().split(":")[1])
-    # game = State()
-    # game.initBoard(cols, rows)
     numOfObstacles = int(input().split(":")[1])
     listOfObstacles = []
     if numOfObstacles != 0:
@@ -225,12 +274,10 @@ def parser(testfile):
         for obstacle in posOfObstacles:
             x, y = PosToXY(obstacle)
             listOfObstacles.append((x, y))
-            # game.board.addObstaclePiece(x, y)
     else:
         input()
  
     K = int(input().split(":")[1])
-    # game.board.setGoal(K)
  
     # enemies
     numOfEachEnemies = input().split(":")[1].split(" ")
@@ -243,101 +290,455 @@ def parser(testfile):
         enemyType, enemyPos = input()[1:][:-1].split(",")
         enemyX, enemyY = PosToXY(enemyPos)
         listOfEnemies.append((enemyType, enemyX, enemyY))
-        # game.board.addEnemyPiece(enemyType, enemyX, enemyY)
-    # game.board.updateThreatened()
-    f.close()
     return (rows, cols, K, listOfObstacles, listOfEnemies)
  
-def randomRestart(rows, cols, K, listOfObstacles, listOfEnemies):
-    randomEnemies = random.sample(listOfEnemies, K)
-    game = State()
-    game.initBoard(cols, rows)
-    for x, y in listOfObstacles:
-        game.board.addObstaclePiece(x, y)
-    for enemyType, enemyX, enemyY in randomEnemies:
-        game.board.addEnemyPiece(enemyType, enemyX, enemyY)
-    game.board.updateThreatened()
- 
-    return game, randomEnemies
- 
-def initGameWithEnemies(rows, cols, listOfObstacles, listOfEnemies) -> State:
-    
-    game = State()
-    game.initBoard(cols, rows)
-    for x, y in listOfObstacles:
-        game.board.addObstaclePiece(x, y)
-    for enemyType, enemyX, enemyY in listOfEnemies:
-        game.board.addEnemyPiece(enemyType, enemyX, enemyY)
- 
-    return game
+def randomRestart(rows, cols, K, listOfObstacles, listOfEnemies, index: PieceIndex = None):
+    '''ThreatBoard holding K of the enemies drawn at random, and those enemies'''
+    randomEnemies = random.sample(range(len(listOfEnemies)), K)
+    if index == None:
+        index = PieceIndex(cols, rows, listOfObstacles, listOfEnemies)
+    board = ThreatBoard(index)
+    for i in randomEnemies:
+        board.addPiece(i)
+ 
+    return board, [listOfEnemies[i] for i in randomEnemies]
+ 
+def writeTrace(record: dict) -> None:
+    '''Append a record to TRACE_PATH as a JSON line'''
+    if TRACE_PATH == None:
+        return
+    with open(TRACE_PATH, "a") as f:
+        f.write(json.dumps(record) + "\n")
+ 
+ 
+def search(testfile, budget: float = None):
+    '''Goal state of the test file. The search gives up once it has restarted MAX_RESTARTS times, has
+    evaluated MAX_NEIGHBOURS neighbours or, given a budget in seconds, once the budget runs out, and
+    returns the configuration with the fewest threatened pieces seen.'''
+    return searchInstance(parser(testfile), budget)
+ 
+def solveInstance(instance, budget: float = None):
+    '''Goal state of an instance given as parsed by parser or as the text of a test file'''
+    if isinstance(instance, str):
+        instance = parseText(instance)
+    return searchInstance(instance, budget)
+ 
+def solveAnytime(instance, budget: float = None):
+    '''Like solveInstance, also returning whether the configuration is a goal state'''
+    if isinstance(instance, str):
+        instance = parseText(instance)
+    return searchAnytime(instance, budget)
+ 
+def searchInstance(instance, budget: float = None):
+    result, _, _ = runSearch(instance, budget)
+    return result
+ 
+def searchAnytime(instance, budget: float = None):
+    '''Configuration with the fewest threatened pieces seen before the budget in seconds ran out,
+    and whether it is a goal state'''
+    result, isGoal, _ = runSearch(instance, budget)
+    return result, isGoal
+ 
+def searchWithStats(instance, budget: float = None, mode: str = None):
+    '''Goal state of a parsed instance and, if INSTRUMENT is set, the statistics of the search as a
+    dict (None otherwise), which are written to TRACE_PATH as well. The cost trajectory holds the
+    number of threatened pieces after each step, one list per restart, and stepsToGoal the number of
+    steps taken before the goal state was reached (None if it was not).'''
+    result, _, record = runSearch(instance, budget, mode)
+    return result, record
+ 
+def luby(i: int) -> int:
+    '''The i-th term of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ..., counting from 1'''
+    while True:
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+ 
+def getRestartSteps(numOfRestarts: int, policy: str = None) -> int:
+    '''Steps without a lower cost after which the run following the number of restarts restarts, with
+    RESTART_POLICY by default'''
+    if policy == None:
+        policy = RESTART_POLICY
+    if policy == "luby":
+        steps = RESTART_AFTER_STEPS * luby(numOfRestarts + 1)
+    elif policy == "geometric":
+        # growing one run at a time rather than raising to the power keeps the float from overflowing
+        steps = RESTART_AFTER_STEPS
+        for _ in range(numOfRestarts):
+            steps *= RESTART_GROWTH
+            if steps >= MAX_RESTART_STEPS:
+                break
+    else:
+        steps = RESTART_AFTER_STEPS
+    return min(round(steps), MAX_RESTART_STEPS)
+ 
+class SearchProgress:
+    '''Best configuration a search has seen, its deadline, when its runs restart and, if INSTRUMENT is set,
+    its statistics'''
+ 
+    def __init__(self, instance, budget: float = None, mode: str = None) -> None:
+        rows, cols, k, _, _ = instance
+        self.startTime = time()
+        self.deadline = None if budget == None else self.startTime + budget
+        self.bestCost = None
+        self.best = None
+        self.numOfRestarts = 0
+        self.neighboursEvaluated = 0
+        self.runCost = None
+        self.stepsWithoutImprovement = 0
+        self.stepsBeforeRestart = None
+        self.header = {"solver": "Local", "mode": SEARCH_MODE if mode == None else mode, "restartPolicy": RESTART_POLICY,
+                       "rows": rows, "cols": cols, "k": k}
+        self.stats = None
+        if INSTRUMENT:
+            self.stats = {"restarts": 0, "steps": 0, "neighboursEvaluated": 0, "costTrajectory": []}
+ 
+    def isOverBudget(self) -> bool:
+        '''Whether the search has evaluated MAX_NEIGHBOURS neighbours or its deadline has passed'''
+        if MAX_NEIGHBOURS != None and self.neighboursEvaluated >= MAX_NEIGHBOURS:
+            return True
+        # every step evaluates at least one neighbour, which costs far more than reading the clock
+        return self.deadline != None and time() > self.deadline
+ 
+    def isDone(self, board: ThreatBoard) -> bool:
+        '''Keep the configuration of the board if it is the best so far. Returns whether the search is
+        over: the board is a goal state or the budget has run out.'''
+        if self.bestCost == None or board.cost < self.bestCost:
+            self.bestCost = board.cost
+            self.best = board.getGoalState()
+        return board.cost == 0 or self.isOverBudget()
+ 
+    def countStart(self, cost: int, unit: int = 1) -> None:
+        '''Start a run from a configuration of the cost. The run is stuck once it has gone the steps of the
+        restart policy, times the unit, without a lower cost.'''
+        self.runCost = cost
+        self.stepsWithoutImprovement = 0
+        self.stepsBeforeRestart = getRestartSteps(self.numOfRestarts) * unit
+        if self.stats != None:
+            self.stats["costTrajectory"].append([cost])
+ 
+    def countStep(self, cost: int, neighboursEvaluated: int) -> None:
+        self.neighboursEvaluated += neighboursEvaluated
+        if cost < self.runCost:
+            self.runCost = cost
+            self.stepsWithoutImprovement = 0
+        else:
+            self.stepsWithoutImprovement += 1
+        if self.stats != None:
+            self.stats["steps"] += 1
+            self.stats["costTrajectory"][-1].append(cost)
+ 
+    def countRejected(self, neighboursEvaluated: int = 1) -> None:
+        '''Count a neighbour a step drew but did not take, as a step without a lower cost'''
+        self.neighboursEvaluated += neighboursEvaluated
+        self.stepsWithoutImprovement += 1
+ 
+    def isStuck(self) -> bool:
+        '''Whether the run should restart'''
+        return self.stepsWithoutImprovement >= self.stepsBeforeRestart
+ 
+    def countRestart(self, neighboursEvaluated: int = 0) -> bool:
+        '''Count a restart if MAX_RESTARTS and the budget allow another. Returns whether they do, the search
+        being over otherwise.'''
+        self.neighboursEvaluated += neighboursEvaluated
+        if MAX_RESTARTS != None and self.numOfRestarts >= MAX_RESTARTS:
+            return False
+        if self.isOverBudget():
+            return False
+        self.numOfRestarts += 1
+        if self.stats != None:
+            self.stats["restarts"] = self.numOfRestarts
+        return True
  
-def goalCheck(game: State) -> bool:
-    return game.board.sumOfThreatened() == 0
+    def getResult(self) -> tuple:
+        '''(best configuration, whether it is a goal state, statistics or None), the statistics being
+        written to TRACE_PATH as well'''
+        if self.stats == None:
+            return self.best, self.bestCost == 0, None
+        record = dict(self.header)
+        record.update({"totalSeconds": time() - self.startTime, "isGoal": self.bestCost == 0, "cost": self.bestCost})
+        record.update(self.stats)
+        record["neighboursEvaluated"] = self.neighboursEvaluated
+        record["stepsToGoal"] = self.stats["steps"] if self.bestCost == 0 else None
+        writeTrace(record)
+        return self.best, self.bestCost == 0, record
+ 
+def runSearch(instance, budget: float = None, mode: str = None):
+    '''Search with the mode, SEARCH_MODE by default, until a goal state is found, the budget in seconds
+    or MAX_NEIGHBOURS runs out or the search has restarted MAX_RESTARTS times.
+    Returns the configuration with the fewest threatened pieces seen, whether it is a goal state and
+    the statistics of the search (None unless INSTRUMENT is set).'''
+    rows, cols, k, listOfObstacles, listOfAllEnemies = instance
+    index = PieceIndex(cols, rows, listOfObstacles, listOfAllEnemies, CSP.getAttackTable(cols, rows, listOfObstacles))
+    if mode == None:
+        mode = SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError("unknown search mode " + repr(mode))
+    progress = SearchProgress(instance, budget, mode)
+    if mode == "beam":
+        beamSearch(instance, index, progress)
+    elif mode == "annealing":
+        simulatedAnnealing(instance, index, progress)
+    elif mode == "tabu":
+        tabuSearch(instance, index, progress)
+    else:
+        hillClimb(instance, index, progress)
+    return progress.getResult()
  
+def hillClimb(instance, index: PieceIndex, progress: SearchProgress) -> None:
+    '''Hill climbing with random restarts until the progress says the search is over.
  
-def search(testfile):
-    rows, cols, k, listOfObstacles, listOfAllEnemies = parser(testfile)
-    numOfRestarts = 0
+    Each step moves to the neighbour with the fewest threats, or to one with as many at random when
+    none has fewer. A run restarts once the restart policy says it is stuck, or at a local minimum
+    with no neighbour as good.'''
+    rows, cols, k, listOfObstacles, listOfAllEnemies = instance
     while True:
-        game, kSamplesOfEnemies = randomRestart(rows, cols, k, listOfObstacles, listOfAllEnemies)
-        # steps = 0
+        board, _ = randomRestart(rows, cols, k, listOfObstacles, listOfAllEnemies, index)
+        progress.countStart(board.cost)
+        neighboursEvaluated = 0
         while True:
  
-            if goalCheck(game):
-                # print(steps)
-                # print(numOfRestarts)
-                result = {}
-                for pos in game.board.enemyPos:
-                    result[XYtoPos(pos)] = game.board.enemyPos[pos].type
-                return result
-                
+            cost = board.cost
+            if progress.isDone(board):
+                return
+            if progress.isStuck():
+                break
             
-            # finding a neighbour
-            x, y, num_of_most_threatened = game.board.getMostThreatenedPos()
+            # finding a neighbour: take the most threatened piece off the board and put back the enemy
+            # that leaves the fewest threats, each evaluated from the lines through it only
+            removed, num_of_most_threatened = board.getMostThreatened()
+            board.removePiece(removed)
  
-            # remove the most threatened from the k samples
-            for i in range(k):
-                if kSamplesOfEnemies[i][1] == x and kSamplesOfEnemies[i][2] == y:
-                    kSamplesOfEnemies.pop(i)
-                    break
- 
-            improved = False
             best_cost = None
             best_enemy = None
-            for enemyNotPresent in listOfAllEnemies:
+            sideways = []
+            for enemyNotPresent in range(len(listOfAllEnemies)):
                 
-                new_type, new_x, new_y = enemyNotPresent
-                if (enemyNotPresent in kSamplesOfEnemies) or (
-                    new_x == x and new_y == y):
+                if (enemyNotPresent in board.pieces) or enemyNotPresent == removed:
                     continue
                 
-                
-                test = initGameWithEnemies(rows, cols, listOfObstacles, kSamplesOfEnemies)
-                new_type, new_x, new_y = enemyNotPresent
-                test.board.addEnemyPiece(new_type, new_x, new_y)
-                test.board.updateThreatened()
-                new_cost = test.board.sumOfThreatened()
-                if new_cost >= game.board.sumOfThreatened():
-                    continue
-                else:
-                    improved = True
-                    if (best_cost == None or new_cost < best_cost):
-                        best_cost = new_cost
-                        game = test
-                        best_enemy = enemyNotPresent
-                    
+                neighboursEvaluated += 1
+                new_cost = board.cost + board.getAddedCost(enemyNotPresent)
+                if new_cost < cost and (best_cost == None or new_cost < best_cost):
+                    best_cost = new_cost
+                    best_enemy = enemyNotPresent
+                elif new_cost == cost:
+                    sideways.append(enemyNotPresent)
             
-            if not improved:
-                break
-            kSamplesOfEnemies.append(best_enemy)
+            if best_enemy == None:
+                if len(sideways) == 0:
+                    break
+                best_cost = cost
+                best_enemy = random.choice(sideways)
+            board.addPiece(best_enemy)
+            progress.countStep(best_cost, neighboursEvaluated)
+            neighboursEvaluated = 0
                     
-        # print("restarted")
-        
-        # numOfRestarts += 1
-        # if numOfRestarts > MAX_RESTARTS:
-        #     return {}
+        if not progress.countRestart(neighboursEvaluated):
+            return
+ 
+def beamSearch(instance, index: PieceIndex, progress: SearchProgress, width: int = None) -> None:
+    '''Local beam search until the progress says the search is over.
+ 
+    The beam holds the width best selections of K enemies found at each step, starting from random
+    ones. Every step swaps each enemy on the board of each selection for each enemy off it and keeps the
+    width best of all those neighbours that were not in a beam since the last restart, so the beam
+    moves on even when no neighbour is better. Selections are told apart by a hash of the enemies in
+    them, the XOR of a random key per enemy, which a swap updates with two XORs. The search restarts
+    from new random selections when the restart policy says the beam is stuck.'''
+    if width == None:
+        width = BEAMS
+    rows, cols, k, listOfObstacles, listOfAllEnemies = instance
+    keys = [random.getrandbits(64) for _ in listOfAllEnemies]
+    while True:
+        beam = []
+        hashes = []
+        for _ in range(width):
+            board, _ = randomRestart(rows, cols, k, listOfObstacles, listOfAllEnemies, index)
+            beam.append(board)
+            hashes.append(0)
+            for i in board.pieces:
+                hashes[-1] ^= keys[i]
+        visited = set(hashes)
+        progress.countStart(min([board.cost for board in beam]))
+        neighboursEvaluated = 0
+ 
+        while True:
+            for board in beam:
+                if progress.isDone(board):
+                    return
+ 
+            # the width best neighbours, kept in a heap with the worst of them on top
+            heap = []
+            inHeap = set()
+            for parent, board in enumerate(beam):
+                # taking off an enemy that neither threatens nor is threatened cannot remove a threat
+                involved = [i for i in board.pieces if board.countThreats(i) != (0, 0)]
+                for removed in involved:
+                    board.removePiece(removed)
+                    for added in range(len(listOfAllEnemies)):
+                        if added in board.pieces or added == removed:
+                            continue
+                        neighboursEvaluated += 1
+                        cost = board.cost + board.getAddedCost(added)
+                        if len(heap) == width and cost >= -heap[0][0]:
+                            continue
+                        neighbourHash = hashes[parent] ^ keys[removed] ^ keys[added]
+                        if neighbourHash in visited or neighbourHash in inHeap:
+                            continue
+                        neighbour = (-cost, random.random(), neighbourHash, parent, removed, added)
+                        if len(heap) == width:
+                            inHeap.discard(heapq.heapreplace(heap, neighbour)[2])
+                        else:
+                            heapq.heappush(heap, neighbour)
+                        inHeap.add(neighbourHash)
+                    board.addPiece(removed)
+            if len(heap) == 0:
+                break
+ 
+            nextBeam = []
+            nextHashes = []
+            for _, _, neighbourHash, parent, removed, added in heap:
+                board = beam[parent].copy()
+                board.removePiece(removed)
+                board.addPiece(added)
+                nextBeam.append(board)
+                nextHashes.append(neighbourHash)
+                visited.add(neighbourHash)
+            beam, hashes = nextBeam, nextHashes
+ 
+            progress.countStep(min([board.cost for board in beam]), neighboursEvaluated)
+            neighboursEvaluated = 0
+            if progress.isStuck():
+                break
+        if not progress.countRestart(neighboursEvaluated):
+            return
     
  
+def getTemperature(step: int, schedule: str = None) -> float:
+    '''Temperature of simulated annealing the step into a cooling cycle, with ANNEALING_SCHEDULE by default'''
+    if schedule == None:
+        schedule = ANNEALING_SCHEDULE
+    fraction = step / ANNEALING_CYCLE_STEPS
+    if schedule == "linear":
+        return ANNEALING_START_TEMPERATURE + (ANNEALING_END_TEMPERATURE - ANNEALING_START_TEMPERATURE) * fraction
+    if schedule == "logarithmic":
+        # T0 / (1 + c log(1 + step)), with c chosen to reach the end temperature at the end of the cycle
+        c = (ANNEALING_START_TEMPERATURE / ANNEALING_END_TEMPERATURE - 1) / log(1 + ANNEALING_CYCLE_STEPS)
+        return ANNEALING_START_TEMPERATURE / (1 + c * log(1 + step))
+    return ANNEALING_START_TEMPERATURE * (ANNEALING_END_TEMPERATURE / ANNEALING_START_TEMPERATURE) ** fraction
+ 
+def simulatedAnnealing(instance, index: PieceIndex, progress: SearchProgress) -> None:
+    '''Simulated annealing until the progress says the search is over.
+ 
+    Each step draws one neighbour at random, swapping an enemy on the board that threatens or is
+    threatened for any enemy off it, and takes it if it has no more threats or, with a probability that
+    falls as the temperature cools, even if it has. A step counts a neighbour taken. The restart policy
+    counts every neighbour drawn, in ANNEALING_RESTART_UNITs, since most of them do not lower the cost.'''
+    rows, cols, k, listOfObstacles, listOfAllEnemies = instance
+    while True:
+        board, _ = randomRestart(rows, cols, k, listOfObstacles, listOfAllEnemies, index)
+        # the enemies on and off the board, so that a random one is drawn and swapped in constant time
+        onBoard = list(board.pieces)
+        offBoard = [i for i in range(len(listOfAllEnemies)) if i not in board.pieces]
+        if len(offBoard) == 0:
+            progress.isDone(board)
+            return
+        progress.countStart(board.cost, ANNEALING_RESTART_UNIT)
+        neighboursEvaluated = 0
+        step = 0
+        while not progress.isStuck():
+            if progress.isDone(board):
+                return
+            temperature = getTemperature(step % ANNEALING_CYCLE_STEPS)
+            step += 1
+ 
+            # a board with threats has a pair of enemies involved in one, so this ends
+            while True:
+                position = random.randrange(k)
+                if board.countThreats(onBoard[position]) != (0, 0):
+                    break
+            removed = onBoard[position]
+            addedPosition = random.randrange(len(offBoard))
+            added = offBoard[addedPosition]
+ 
+            cost = board.cost
+            board.removePiece(removed)
+            neighboursEvaluated += 1
+            change = board.cost + board.getAddedCost(added) - cost
+            if change <= 0 or random.random() < exp(-change / temperature):
+                board.addPiece(added)
+                onBoard[position], offBoard[addedPosition] = added, removed
+                progress.countStep(board.cost, neighboursEvaluated)
+                neighboursEvaluated = 0
+            else:
+                board.addPiece(removed)
+                progress.countRejected(neighboursEvaluated)
+                neighboursEvaluated = 0
+        if not progress.countRestart(neighboursEvaluated):
+            return
+ 
+def tabuSearch(instance, index: PieceIndex, progress: SearchProgress, tenure: int = None) -> None:
+    '''Tabu search until the progress says the search is over.
+ 
+    Each step moves to the best neighbour, swapping an enemy on the board that threatens or is
+    threatened for an enemy off it, even when it is worse than the current selection. The enemies a
+    step swaps are tabu for the next tenure steps, TABU_TENURE by default: the one taken off cannot be
+    put back and the one put on cannot be taken off, which keeps the search from undoing its moves. A
+    tabu move is still taken if it gives a lower cost than any seen (aspiration). The search restarts
+    from a new random selection when the restart policy says it is stuck.'''
+    if tenure == None:
+        tenure = TABU_TENURE
+    rows, cols, k, listOfObstacles, listOfAllEnemies = instance
+    while True:
+        board, _ = randomRestart(rows, cols, k, listOfObstacles, listOfAllEnemies, index)
+        progress.countStart(board.cost)
+        # the step up to which each enemy may not be swapped
+        tabuUntil = [0] * len(listOfAllEnemies)
+        neighboursEvaluated = 0
+        step = 0
+        while not progress.isStuck():
+            if progress.isDone(board):
+                return
+            step += 1
+            best = None
+            evaluatedBefore = neighboursEvaluated
+            involved = [i for i in board.pieces if board.countThreats(i) != (0, 0)]
+            for removed in involved:
+                board.removePiece(removed)
+                for added in range(len(listOfAllEnemies)):
+                    if added in board.pieces or added == removed:
+                        continue
+                    neighboursEvaluated += 1
+                    cost = board.cost + board.getAddedCost(added)
+                    isTabu = tabuUntil[removed] >= step or tabuUntil[added] >= step
+                    if isTabu and cost >= progress.bestCost:
+                        continue
+                    # ties are broken at random so that the search does not cycle between equal selections
+                    neighbour = (cost, random.random(), removed, added)
+                    if best == None or neighbour < best:
+                        best = neighbour
+                board.addPiece(removed)
+            if neighboursEvaluated == evaluatedBefore:
+                break
+            if best == None:
+                # every move is tabu, so the step passes without one
+                progress.countStep(board.cost, neighboursEvaluated)
+                neighboursEvaluated = 0
+                continue
+ 
+            cost, _, removed, added = best
+            board.removePiece(removed)
+            board.addPiece(added)
+            tabuUntil[removed] = tabuUntil[added] = step + tenure
+            progress.countStep(cost, neighboursEvaluated)
+            neighboursEvaluated = 0
+        if not progress.countRestart(neighboursEvaluated):
+            return
+ 
 ### DO NOT EDIT/REMOVE THE FUNCTION HEADER BELOW###
 # To return: Goal State which is a dictionary containing a mapping of the position of the grid to the chess piece type.
 # Chess Pieces: King, Queen, Knight, Bishop, Rook (First letter capitalized)
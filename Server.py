@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import signal
+import argparse
+import multiprocessing
+import socketserver
+from time import time
+
+import CSP
+import Local
+import Cache
+
+NUM_OF_WORKERS = multiprocessing.cpu_count()
+
+PIECE_TYPES = ["King", "Queen", "Bishop", "Rook", "Knight"]
+
+solutionCache = None  # Cache.SolutionCache of the worker, if the server was given one
+defaultBudget = None  # seconds given to requests that do not set their own budget
+
+def isLocalInstance(text: str) -> bool:
+    '''Local search instances are the ones whose header gives K, the number of pieces left in the goal'''
+    for line in text.splitlines():
+        if line.startswith("K"):
+            return True
+    return False
+
+def toText(request: dict) -> str:
+    '''Text of a test file for an instance given as JSON fields: rows, cols, obstacles (positions
+    such as "a0"), pieces (numbers of King, Queen, Bishop, Rook, Knight, as a list or by type) and,
+    for local search, k and positions (pairs of piece type and position)'''
+    obstacles = request.get("obstacles", [])
+    lines = ["Rows:" + str(request["rows"]),
+             "Cols:" + str(request["cols"]),
+             "Number of Obstacles:" + str(len(obstacles)),
+             "Position of Obstacles (space between):" + (" ".join(obstacles) if len(obstacles) != 0 else "-")]
+    isLocal = "k" in request
+    if isLocal:
+        lines.append("K (Minimum number of pieces left in goal):" + str(request["k"]))
+
+    pieces = request.get("pieces")
+    if pieces == None:
+        pieces = [[pieceType for pieceType, _ in request["positions"]].count(pieceType) for pieceType in PIECE_TYPES]
+    elif isinstance(pieces, dict):
+        pieces = [pieces.get(pieceType, 0) for pieceType in PIECE_TYPES]
+    lines.append("Number of King, Queen, Bishop, Rook, Knight (space between):" + " ".join([str(num) for num in pieces]))
+
+    if isLocal:
+        lines.append("Position of Pieces [Piece, Pos]:")
+        for pieceType, pos in request["positions"]:
+            lines.append("[" + pieceType + "," + pos + "]")
+    return "\n".join(lines) + "\n"
+
+def readRequests(lines):
+    '''Yield (request id, request) for each request read from the lines: either a line holding a
+    JSON object, or the lines of a test file up to an empty line or the end of the input.
+    Requests are numbered in the order they are read; JSON requests may name their own "id".'''
+    numOfRequests = 0
+    block = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if len(block) == 0:
+            if line.strip() == "":
+                continue
+            if line.lstrip().startswith("{"):
+                yield (numOfRequests, line)
+                numOfRequests += 1
+                continue
+        if line.strip() == "":
+            yield (numOfRequests, "\n".join(block) + "\n")
+            numOfRequests += 1
+            block = []
+            continue
+        block.append(line)
+    if len(block) != 0:
+        yield (numOfRequests, "\n".join(block) + "\n")
+
+def solveRequest(request: tuple) -> dict:
+    '''Solve a request in a worker. The response holds the goal state with positions such as "a0"
+    (None if there is no solution), whether it is a goal state and the seconds spent on the request,
+    or the error it raised. JSON requests may set a "budget" in seconds, after which the solvers
+    return their best effort: the largest partial assignment for CSP, the configuration with the
+    fewest threatened pieces for Local.
+
+    Each worker keeps the solvers' attack tables between requests, so requests on a board size and
+    obstacles that the worker has seen before skip building them.'''
+    requestId, text = request
+    startTime = time()
+    response = {"id": requestId}
+    try:
+        budget = defaultBudget
+        if text.lstrip().startswith("{"):
+            fields = json.loads(text)
+            response["id"] = fields.get("id", requestId)
+            budget = fields.get("budget", budget)
+            text = fields["text"] if "text" in fields else toText(fields)
+        isLocal = isLocalInstance(text)
+        response["solver"] = "Local" if isLocal else "CSP"
+        if solutionCache != None:
+            goalState, isGoal = Cache.solveAnytime(text, isLocal, solutionCache, budget)
+        elif isLocal:
+            goalState, isGoal = Local.solveAnytime(text, budget)
+        else:
+            goalState, isGoal = CSP.solveAnytime(text, budget)
+    except Exception as error:
+        response["error"] = repr(error)
+        response["seconds"] = time() - startTime
+        return response
+
+    if goalState == None or goalState == False:
+        response["goalState"] = None
+    else:
+        response["goalState"] = {}
+        for pos, pieceType in goalState.items():
+            response["goalState"][pos[0] + str(pos[1])] = pieceType
+    response["isGoal"] = isGoal
+    response["seconds"] = time() - startTime
+    return response
+
+def initWorker(cachePath: str = None, budget: float = None) -> None:
+    '''Leave interrupts to the serving process, which shuts the workers down, and open the
+    solution cache if there is one'''
+    global solutionCache, defaultBudget
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    defaultBudget = budget
+    if cachePath != None:
+        solutionCache = Cache.SolutionCache(cachePath)
+
+def serveLines(pool, lines, write) -> None:
+    '''Solve the requests read from the lines on the pool, writing each response as a JSON line
+    as soon as it is ready'''
+    for response in pool.imap_unordered(solveRequest, readRequests(lines)):
+        write(json.dumps(response) + "\n")
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    '''Serves the requests sent over one connection to the socket'''
+
+    def handle(self) -> None:
+        lines = (line.decode() for line in self.rfile)
+        serveLines(self.server.pool, lines, lambda response: self.wfile.write(response.encode()))
+
+def serveStdin(numOfWorkers: int = None, cachePath: str = None, budget: float = None) -> None:
+    if numOfWorkers == None:
+        numOfWorkers = NUM_OF_WORKERS
+    with multiprocessing.Pool(numOfWorkers, initWorker, (cachePath, budget)) as pool:
+        def write(response: str) -> None:
+            sys.stdout.write(response)
+            sys.stdout.flush()
+        serveLines(pool, sys.stdin, write)
+
+def serveSocket(socketPath: str, numOfWorkers: int = None, cachePath: str = None, budget: float = None) -> None:
+    '''Serve the connections to a Unix socket at the path until interrupted, sharing one worker pool'''
+    if numOfWorkers == None:
+        numOfWorkers = NUM_OF_WORKERS
+    if os.path.exists(socketPath):
+        os.remove(socketPath)
+    with multiprocessing.Pool(numOfWorkers, initWorker, (cachePath, budget)) as pool:
+        with socketserver.ThreadingUnixStreamServer(socketPath, RequestHandler) as server:
+            server.daemon_threads = True
+            server.pool = pool
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(socketPath)
+
+def main() -> None:
+    argumentParser = argparse.ArgumentParser(description="Solve CSP and Local instances sent over stdin or a Unix socket. "
+                                             "Each request is a JSON object on one line or the text of a test file ended by an empty line, "
+                                             "and each response is a JSON line.")
+    argumentParser.add_argument("--socket", help="path of a Unix socket to listen on instead of reading stdin")
+    argumentParser.add_argument("--workers", type=int, default=NUM_OF_WORKERS, help="number of worker processes")
+    argumentParser.add_argument("--cache", help="path of an SQLite database of solutions to answer repeated instances from")
+    argumentParser.add_argument("--budget", type=float, help="seconds per request, after which the best effort is returned")
+    arguments = argumentParser.parse_args()
+    try:
+        if arguments.socket == None:
+            serveStdin(arguments.workers, arguments.cache, arguments.budget)
+        else:
+            serveSocket(arguments.socket, arguments.workers, arguments.cache, arguments.budget)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+from time import time
+
+import pytest
+
+import CSP
+from Cache import isValidSolution
+
+TIME_LIMIT = 10  # seconds any one search may take before the test fails
+
+def walledBoard(n: int) -> list:
+    '''Obstacles filling columns n // 2 and n // 2 + 1, walling the board into two regions'''
+    return [(x, y) for x in (n // 2, n // 2 + 1) for y in range(n)]
+
+def solveWithin(csp: CSP.State, searchFunction):
+    startTime = time()
+    csp.stopCondition = lambda: time() - startTime > TIME_LIMIT
+    return searchFunction(csp)
+
+@pytest.mark.parametrize("n, counts", [(12, (3, 3, 3, 3, 3)), (16, (4, 4, 4, 4, 4)), (16, (3, 5, 4, 5, 3)),
+                                       (20, (5, 5, 5, 5, 5))])
+def test_searchRegionsOnWalledBoard(n, counts):
+    obstacles = walledBoard(n)
+    maxNumOfEachEnemy = dict(zip(CSP.Piece.enemyTypes, counts))
+    assert len(CSP.findRegions(n, n, obstacles)) == 2
+    csp = CSP.State(n, n, obstacles, maxNumOfEachEnemy)
+    solution = solveWithin(csp, CSP.searchRegions)
+    assert solution, "no solution within the time limit"
+    assert isValidSolution(("CSP", n, n, obstacles, counts), solution)
+
+def test_searchRegionsFillsSmallRegions():
+    # four regions of 1, 2, 2 and 28 squares, the large one cannot take every piece on its own
+    cols, rows = 8, 7
+    obstacles = [(0, 1), (0, 4), (1, 0), (1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (1, 6), (2, 0), (2, 1), (2, 2),
+                 (2, 3), (2, 4), (2, 5), (2, 6), (3, 1), (3, 6), (4, 1), (5, 1), (6, 0), (6, 1), (7, 1)]
+    counts = (2, 4, 2, 2, 0)
+    maxNumOfEachEnemy = dict(zip(CSP.Piece.enemyTypes, counts))
+    assert sorted(map(len, CSP.findRegions(cols, rows, obstacles))) == [1, 2, 2, 28]
+    csp = CSP.State(rows, cols, obstacles, maxNumOfEachEnemy)
+    solution = solveWithin(csp, CSP.searchRegions)
+    assert solution, "no solution within the time limit"
+    assert isValidSolution(("CSP", cols, rows, obstacles, counts), solution)
+    assert csp.nodesExpanded < 10 * CSP.MAX_LISTED_PLACEMENTS
+
+def test_searchRegionsFindsNoSolution():
+    # a 2x2 region either side of the wall takes one queen each, so three queens do not fit
+    cols, rows = 6, 2
+    obstacles = [(x, y) for x in (2, 3) for y in range(rows)]
+    maxNumOfEachEnemy = dict(zip(CSP.Piece.enemyTypes, (0, 3, 0, 0, 0)))
+    assert len(CSP.findRegions(cols, rows, obstacles)) == 2
+    csp = CSP.State(rows, cols, obstacles, maxNumOfEachEnemy)
+    assert solveWithin(csp, CSP.searchRegions) == False
+
+def roomsBoard(numOfRooms: int, roomSize: int) -> list:
+    '''Obstacles walling a board into numOfRooms x numOfRooms rooms of roomSize squares a side, with
+    walls two squares thick so that no knight jumps them'''
+    n = numOfRooms * (roomSize + 2) - 2
+    return [(x, y) for x in range(n) for y in range(n) if x % (roomSize + 2) >= roomSize or y % (roomSize + 2) >= roomSize]
+
+@pytest.mark.parametrize("roomSize, counts, solvable", [(3, (0, 18, 0, 0, 0), True), (3, (0, 19, 0, 0, 0), False),
+                                                        (3, (37, 0, 0, 0, 0), False), (4, (9, 27, 0, 0, 0), True)])
+def test_runSearchOnRooms(roomSize, counts, solvable):
+    # 3x3 rooms take two queens or four kings each. backTrack on the whole board runs out of time on all but the first
+    obstacles = roomsBoard(3, roomSize)
+    n = 3 * (roomSize + 2) - 2
+    assert len(CSP.findRegions(n, n, obstacles)) == 9
+    csp = CSP.State(n, n, obstacles, dict(zip(CSP.Piece.enemyTypes, counts)))
+    solution = solveWithin(csp, CSP.runSearch)
+    assert solution != None, "no result within the time limit"
+    if solvable:
+        assert isValidSolution(("CSP", n, n, obstacles, counts), solution)
+    else:
+        assert solution == False
+
+@pytest.mark.parametrize("size, pieces", [(3, {"King": 3}), (3, {"Knight": 3}), (4, {"Knight": 3}), (5, {"King": 4}),
+                                          (5, {"Knight": 4}), (4, {"King": 2, "Knight": 2})])
+def test_countSolutionsOnSymmetricBoard(size, pieces):
+    # an empty square board has all eight symmetries, so counting goes through its orbits
+    maxNumOfEachEnemy = {pieceType: pieces.get(pieceType, 0) for pieceType in CSP.Piece.enemyTypes}
+    solutions = sum(1 for _ in CSP.exploreSolutions(CSP.State(size, size, [], dict(maxNumOfEachEnemy))))
+    assert CSP.countSolutions(CSP.State(size, size, [], dict(maxNumOfEachEnemy))) == solutions
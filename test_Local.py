@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+import Local
+
+def getStepsWithoutImprovement(trajectory: list) -> int:
+    '''Steps at the end of a run's cost trajectory without a lower cost than the run had before them'''
+    lowest = trajectory[0]
+    steps = 0
+    for cost in trajectory[1:]:
+        if cost < lowest:
+            lowest = cost
+            steps = 0
+        else:
+            steps += 1
+    return steps
+
+def test_restartPoliciesInHillClimbing(monkeypatch):
+    # five queens never fit on a 4x4 board, so every run ends in a restart
+    instance = (4, 4, 5, [], [("Queen", x, y) for x in range(4) for y in range(4)])
+    monkeypatch.setattr(Local, "INSTRUMENT", True)
+    monkeypatch.setattr(Local, "TRACE_PATH", None)
+    monkeypatch.setattr(Local, "RESTART_AFTER_STEPS", 1)
+    monkeypatch.setattr(Local, "MAX_RESTARTS", 30)
+    schedules = {}
+    for policy in ["fixed", "luby"]:
+        monkeypatch.setattr(Local, "RESTART_POLICY", policy)
+        random.seed(0)
+        _, isGoal, record = Local.runSearch(instance, mode="hill-climbing")
+        assert not isGoal
+        assert record["restarts"] == 30
+        schedules[policy] = [getStepsWithoutImprovement(trajectory) for trajectory in record["costTrajectory"]]
+
+    # each run stops at the steps of its policy, 1 for "fixed" and 1, 1, 2, 1, 1, 2, 4, ... for "luby"
+    for i, steps in enumerate(schedules["fixed"]):
+        assert steps <= Local.getRestartSteps(i, "fixed") == 1
+    for i, steps in enumerate(schedules["luby"]):
+        assert steps <= Local.getRestartSteps(i, "luby")
+    assert max(schedules["luby"]) > 1
+    assert schedules["fixed"] != schedules["luby"]
+
+@pytest.mark.parametrize("mode", Local.SEARCH_MODES)
+@pytest.mark.parametrize("policy", Local.RESTART_POLICIES)
+def test_searchStopsAfterMaxNeighbours(monkeypatch, mode, policy):
+    # five queens never fit on a 4x4 board, so only the budget ends the search
+    instance = (4, 4, 5, [], [("Queen", x, y) for x in range(4) for y in range(4)])
+    monkeypatch.setattr(Local, "INSTRUMENT", True)
+    monkeypatch.setattr(Local, "TRACE_PATH", None)
+    monkeypatch.setattr(Local, "RESTART_POLICY", policy)
+    monkeypatch.setattr(Local, "MAX_RESTARTS", None)
+    monkeypatch.setattr(Local, "MAX_NEIGHBOURS", 5000)
+    random.seed(0)
+    _, isGoal, record = Local.runSearch(instance, mode=mode)
+    assert not isGoal
+    # the budget is checked between steps, and a beam step evaluates at most every swap of every board
+    assert 5000 <= record["neighboursEvaluated"] <= 5000 + Local.BEAMS * 5 * 11